@@ -1,66 +1,312 @@
 import os
 import time
-from flask import Flask, request, jsonify
+import functools
+import hashlib
+from collections import OrderedDict
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+from flask import Flask, Response, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from dotenv import load_dotenv
 import google.generativeai as genai
 
 # RAG imports
+import rag.document
 from rag.document import extract_text_from_pdf, split_text
+from langchain.schema import Document
 from rag.faiss_store import FAISSVectorStore
 from rag.chroma_store import ChromaVectorStore
-from rag.utils import save_uploaded_file, format_results
+from rag.utils import save_uploaded_file, format_results, normalize_embeddings
+from rag.cache import ProximityCache
+from rag.embedding_cache import EmbeddingCache
 from langchain_google_genai import GoogleGenerativeAIEmbeddings  # Changed from OpenAI to Google
 from rag.mongo_store import MongoVectorStore
 from rag.pgvector_store import PGVectorStore
-from rag.milvus_store import MilvusVectorStore
 
 # Load environment variables
 load_dotenv()
 
+# Local data (uploads, caches) lives next to the app, independent of the
+# working directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson for faster request parsing and responses"""
+    
+    def _dumps_bytes(self, obj):
+        return orjson.dumps(
+            obj,
+            default=self.default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+    
+    def dumps(self, obj, **kwargs):
+        return self._dumps_bytes(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Build the body from orjson's bytes directly, skipping the str round-trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._dumps_bytes(obj), mimetype=self.mimetype)
+
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
+# Report per-store indexing times from /api/upload (used by the performance view)
+app.config["PROFILE_UPLOADS"] = os.getenv("PROFILE_UPLOADS", "true").lower() in ("1", "true", "yes")
 # Enable CORS for all routes and all origins
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-# Configure the Gemini API
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# Configure the Gemini API. The SDK keeps one client, and so one persistent
+# HTTP/2 gRPC channel, per process; every chat, RAG and embedding call goes
+# through it from the request and I/O pool threads.
+genai.configure(api_key=os.getenv("GEMINI_API_KEY"), transport="grpc")
 
 # Initialize the model for chat
-model = genai.GenerativeModel('gemini-1.5-flash')
-chat_session = model.start_chat(history=[])
+model = genai.GenerativeModel(os.getenv("GEMINI_MODEL", "gemini-1.5-flash"))
+
+# Separate model instance for stateless RAG answer synthesis, so it never
+# shares state with the chat sessions started from `model`
+rag_model = genai.GenerativeModel(os.getenv("GEMINI_MODEL", "gemini-1.5-flash"))
+
+# Limits on the retrieved context included in the RAG prompt
+RAG_CONTEXT_DOCS = int(os.getenv("RAG_CONTEXT_DOCS", "5"))
+RAG_MAX_CONTEXT_CHARS = int(os.getenv("RAG_MAX_CONTEXT_CHARS", "8000"))
+
+# Prompt for RAG answer synthesis, filled with the query and retrieved context
+RAG_PROMPT_TEMPLATE = """Based on the following information, please answer the query: {query}
+
+Context information:
+{context}
+
+Please provide a concise and accurate answer based only on the context provided.
+If the context doesn't contain relevant information, state that you don't have enough information to answer.
+"""
+
+# Generated answers keyed by (query, context), so identical prompts skip Gemini
+RAG_ANSWER_CACHE_SIZE = int(os.getenv("RAG_ANSWER_CACHE_SIZE", "1024"))
+rag_answer_cache = OrderedDict()
+rag_answer_cache_lock = threading.Lock()
+
+# One chat session per client, each keeping only its most recent turns so
+# prompt size stays bounded; idle sessions are evicted after a TTL
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "10"))
+CHAT_SESSION_TTL = int(os.getenv("CHAT_SESSION_TTL", "3600"))
+chat_sessions = {}
+chat_sessions_lock = threading.Lock()
+
+def get_chat_session(session_id):
+    """Return the chat session for a client, creating it if needed"""
+    now = time.monotonic()
+    with chat_sessions_lock:
+        expired = [
+            sid for sid, (_, last_used) in chat_sessions.items()
+            if now - last_used > CHAT_SESSION_TTL
+        ]
+        for sid in expired:
+            del chat_sessions[sid]
+        
+        if session_id in chat_sessions:
+            session = chat_sessions[session_id][0]
+        else:
+            session = model.start_chat(history=[])
+        chat_sessions[session_id] = (session, now)
+        return session
+
+# Replies to the opening message of a chat, keyed by (model, message), so
+# retries and double-submits of the same prompt skip Gemini. Later turns
+# depend on the session history and are never cached.
+CHAT_REPLY_CACHE_SIZE = int(os.getenv("CHAT_REPLY_CACHE_SIZE", "4096"))
+CHAT_REPLY_CACHE_TTL = int(os.getenv("CHAT_REPLY_CACHE_TTL", "3600"))
+chat_reply_cache = OrderedDict()
+chat_reply_cache_lock = threading.Lock()
+
+def get_cached_chat_reply(key):
+    """Return the cached reply for a key, or None if missing or expired"""
+    with chat_reply_cache_lock:
+        entry = chat_reply_cache.get(key)
+        if entry is None:
+            return None
+        reply, created_at = entry
+        if time.monotonic() - created_at > CHAT_REPLY_CACHE_TTL:
+            del chat_reply_cache[key]
+            return None
+        chat_reply_cache.move_to_end(key)
+        return reply
+
+def cache_chat_reply(key, reply):
+    """Store a reply, evicting the least recently used entry if full"""
+    with chat_reply_cache_lock:
+        chat_reply_cache[key] = (reply, time.monotonic())
+        chat_reply_cache.move_to_end(key)
+        if len(chat_reply_cache) > CHAT_REPLY_CACHE_SIZE:
+            chat_reply_cache.popitem(last=False)
+
+def lookup_chat_reply(chat_session, message, use_cache=True):
+    """
+    Look up a cached reply to the opening message of a chat session
+    
+    On a hit the exchange is recorded in the session history, so follow-up
+    turns keep their context.
+    
+    Returns:
+        tuple: (cache key, or None if the reply must not be cached; cached reply or None)
+    """
+    if chat_session.history or not use_cache:
+        return None, None
+    cache_key = (model.model_name, message)
+    reply = get_cached_chat_reply(cache_key)
+    if reply is not None:
+        chat_session.history = [
+            {"role": "user", "parts": [message]},
+            {"role": "model", "parts": [reply]}
+        ]
+    return cache_key, reply
+
+def trim_chat_history(chat_session):
+    """Keep only the last CHAT_HISTORY_TURNS exchanges (user + model messages)"""
+    max_messages = 2 * CHAT_HISTORY_TURNS
+    if len(chat_session.history) > max_messages:
+        chat_session.history = chat_session.history[-max_messages:]
 
 # Initialize embedding model with Gemini instead of OpenAI
+EMBEDDING_MODEL = "models/embedding-001"
 embedding_model = GoogleGenerativeAIEmbeddings(
-    model="models/embedding-001",
+    model=EMBEDDING_MODEL,
     google_api_key=os.getenv("GEMINI_API_KEY")
 )
 
-# Initialize vector stores
-faiss_store = FAISSVectorStore(embedding_model)
-chroma_store = ChromaVectorStore(embedding_model)
+# Persistent cache of embeddings so each chunk is embedded once, shared by
+# all vector stores and reused across re-uploads and restarts
+embedding_cache = EmbeddingCache(
+    embedding_model, f"google/{EMBEDDING_MODEL}",
+    path=os.path.join(BASE_DIR, "embedding_cache.sqlite3")
+)
+
+# Known output dimensions, so the vector stores don't each spend an API call
+# probing the model at startup; unknown models are probed once (cached on disk)
+EMBEDDING_DIMS = {
+    "models/embedding-001": 768,
+    "models/text-embedding-004": 768
+}
+EMBEDDING_DIM = EMBEDDING_DIMS.get(EMBEDDING_MODEL) or len(embedding_cache.embed_query("test"))
+
+@functools.lru_cache(maxsize=2048)
+def _cached_embed(text):
+    """Embed text once per distinct string; returns a read-only unit-length float32 array"""
+    vector = normalize_embeddings(embedding_cache.embed_query(text))
+    vector.flags.writeable = False
+    return vector
+
+def embed_query(text):
+    """Embed a query, reusing the embedding of previously seen identical text"""
+    normalized = " ".join(text.split())
+    return _cached_embed(normalized)
+
+# Semantic caches for RAG responses, one per database selection
+# ("compare_all" or a db_type), so paraphrased queries skip the pipeline
+RAG_CACHE_CAPACITY = int(os.getenv("RAG_CACHE_CAPACITY", "256"))
+RAG_CACHE_THRESHOLD = float(os.getenv("RAG_CACHE_THRESHOLD", "0.95"))
+RAG_CACHE_TTL = float(os.getenv("RAG_CACHE_TTL", "86400"))
+rag_caches = {
+    scope: ProximityCache(RAG_CACHE_CAPACITY, RAG_CACHE_THRESHOLD, RAG_CACHE_TTL)
+    for scope in ["compare_all", "faiss", "chroma", "weaviate", "mongo", "pgvector", "milvus"]
+}
+
+# Shared pool for blocking I/O fanned out from a request (vector store
+# queries and indexing, saving uploads), so those calls run in parallel
+# instead of one after another on the request thread
+IO_POOL_SIZE = int(os.getenv("IO_POOL_SIZE", "32"))
+io_executor = ThreadPoolExecutor(max_workers=IO_POOL_SIZE, thread_name_prefix="io")
+
+# Uploaded PDFs are kept next to the app
+UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
+os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# Try to import Weaviate, but handle the case where it fails
+# Split chunks of earlier uploads, keyed by a hash of the PDF bytes, so
+# uploading the same file again skips text extraction and splitting
+CHUNK_CACHE_DIR = os.path.join(UPLOAD_DIR, ".chunk_cache")
+os.makedirs(CHUNK_CACHE_DIR, exist_ok=True)
+
+def get_cached_chunks(key):
+    """Return the cached chunks for a PDF hash, or None"""
+    try:
+        with open(os.path.join(CHUNK_CACHE_DIR, f"{key}.json"), "rb") as f:
+            entries = orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+    return [Document(page_content=content, metadata=metadata) for content, metadata in entries]
+
+def cache_chunks(key, chunks):
+    """Store the chunks of a PDF under its hash"""
+    path = os.path.join(CHUNK_CACHE_DIR, f"{key}.json")
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps([(chunk.page_content, chunk.metadata) for chunk in chunks]))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"⚠️ Could not cache document chunks: {str(e)}")
+
+# Background upload jobs, processed one or two at a time so ingestion does
+# not hold HTTP workers; finished jobs are kept for status polling
+UPLOAD_JOB_HISTORY = 100
+upload_jobs = OrderedDict()
+upload_jobs_lock = threading.Lock()
+ingest_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ingest")
+
+# Initialize vector stores. Each constructor mostly waits on network
+# handshakes and schema probes, so all of them run in parallel.
+def create_weaviate_store():
+    from rag.weaviate_store import WeaviateVectorStore
+    # Embeds through the content-addressed cache when called without
+    # precomputed vectors
+    return WeaviateVectorStore(embedding_cache)
+
+def create_milvus_store():
+    from rag.milvus_store import MilvusVectorStore
+    print("Attempting to initialize Milvus...")
+    return MilvusVectorStore(embedding_model, embedding_dim=EMBEDDING_DIM)
+
+faiss_future = io_executor.submit(FAISSVectorStore, embedding_model)
+chroma_future = io_executor.submit(ChromaVectorStore, embedding_model)
+weaviate_future = io_executor.submit(create_weaviate_store)
+mongo_future = io_executor.submit(MongoVectorStore, embedding_model, embedding_dim=EMBEDDING_DIM)
+pgvector_future = io_executor.submit(PGVectorStore, embedding_model, embedding_dim=EMBEDDING_DIM)
+milvus_future = io_executor.submit(create_milvus_store)
+
+faiss_store = faiss_future.result()
+chroma_store = chroma_future.result()
+
+# Weaviate is optional; run without it if it fails to import or connect
 weaviate_available = False
 weaviate_store = None
 try:
-    from rag.weaviate_store import WeaviateVectorStore
-    weaviate_store = WeaviateVectorStore(embedding_model)
-    weaviate_available = True
-    print("Weaviate successfully initialized")
+    weaviate_store = weaviate_future.result()
+    
+    # The store reports connection and schema failures through its flag
+    if weaviate_store.initialized:
+        weaviate_available = True
+        print("Weaviate successfully initialized")
+    else:
+        print("Weaviate initialization failed - running without Weaviate")
 except ImportError as e:
     print(f"Weaviate import failed: {e}")
     print("The application will run without Weaviate support")
 
-mongo_store = MongoVectorStore(embedding_model)
-pgvector_store = PGVectorStore(embedding_model)
-# Add this in app.py where you initialize the stores
-# Initialize Milvus vector store with proper error handling
+mongo_store = mongo_future.result()
+pgvector_store = pgvector_future.result()
+
+# Milvus is optional; run without it if it fails to import or connect
 milvus_available = False
 milvus_store = None
 try:
-    from rag.milvus_store import MilvusVectorStore
-    print("Attempting to initialize Milvus...")
-    milvus_store = MilvusVectorStore(embedding_model)
+    milvus_store = milvus_future.result()
     
     # Check if initialization was successful
     if milvus_store.initialized:
@@ -72,55 +318,162 @@ except Exception as e:
     print(f"❌ Milvus import error: {str(e)}")
     print("The application will run without Milvus support")
 
+# Vector stores and display names by database key, built once at startup
+DB_MAP = {
+    "faiss": faiss_store,
+    "chroma": chroma_store,
+    "weaviate": weaviate_store,
+    "mongo": mongo_store,
+    "pgvector": pgvector_store,
+    "milvus": milvus_store
+}
+DB_NAMES = {
+    "faiss": "FAISS",
+    "chroma": "ChromaDB",
+    "weaviate": "Weaviate",
+    "mongo": "MongoDB",
+    "pgvector": "pgvector",
+    "milvus": "Milvus"
+}
+
+# Databases that can be queried, fixed at startup. Request handlers only
+# read this immutable tuple, so concurrent requests never see it change.
+AVAILABLE_DBS = tuple(
+    db for db, available in (
+        ("faiss", True),
+        ("chroma", True),
+        ("weaviate", weaviate_available),
+        ("mongo", mongo_store.initialized),
+        ("pgvector", pgvector_store.initialized),
+        ("milvus", milvus_available)
+    )
+    if available
+)
+
+def stream_chat(session_id, message, use_cache=True):
+    """
+    Stream a chat reply as server-sent events
+    
+    Each chunk is sent as `data: {"text": ...}`; a cached reply is sent as a
+    single chunk. Failures are sent as an `error` event with
+    `data: {"error": ...}`.
+    """
+    try:
+        chat_session = get_chat_session(session_id)
+        cache_key, reply = lookup_chat_reply(chat_session, message, use_cache)
+        if reply is not None:
+            yield f"data: {orjson.dumps({'text': reply}).decode()}\n\n"
+            return
+        
+        response = chat_session.send_message(message, stream=True)
+        parts = []
+        for chunk in response:
+            parts.append(chunk.text)
+            yield f"data: {orjson.dumps({'text': chunk.text}).decode()}\n\n"
+        trim_chat_history(chat_session)
+        if cache_key is not None:
+            cache_chat_reply(cache_key, "".join(parts))
+    except Exception as e:
+        print(f"Error in chat stream: {str(e)}")
+        yield f"event: error\ndata: {orjson.dumps({'error': str(e)}).decode()}\n\n"
+
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """Handle chat messages"""
     data = request.json
     message = data.get('message', '')
+    session_id = data.get('session_id') or request.cookies.get('session_id') or 'default'
     
     if not message:
         return jsonify({"success": False, "error": "No message provided"})
     
+    if data.get('stream'):
+        return Response(
+            stream_chat(session_id, message, use_cache=not data.get('no_cache')),
+            mimetype='text/event-stream'
+        )
+    
     try:
+        chat_session = get_chat_session(session_id)
+        
+        cache_key, reply = lookup_chat_reply(chat_session, message, use_cache=not data.get('no_cache'))
+        if reply is not None:
+            return jsonify({"success": True, "response": reply})
+        
         response = chat_session.send_message(message)
+        trim_chat_history(chat_session)
+        if cache_key is not None:
+            cache_chat_reply(cache_key, response.text)
         return jsonify({"success": True, "response": response.text})
     except Exception as e:
         print(f"Error in chat: {str(e)}")
         return jsonify({"success": False, "error": str(e)})
 
 
-@app.route('/api/upload', methods=['POST'])
-def upload():
+def index_documents(name, store, documents, embeddings=None):
     """
-    Handle document upload, process text, and index in all vector stores
-    Returns performance metrics for each database
+    Add documents to a single vector store and time the operation
+    
+    Stores raise when indexing fails, so a failure is never timed as success.
+    
+    Returns:
+        tuple: (store name, elapsed seconds or -1 on failure); elapsed is 0
+        when upload profiling is disabled
     """
-    if 'file' not in request.files:
-        return jsonify({"success": False, "message": "No file provided"})
+    try:
+        if not app.config["PROFILE_UPLOADS"]:
+            store.add_documents(documents, embeddings=embeddings)
+            return name, 0
         
-    file = request.files['file']
+        start_ns = time.perf_counter_ns()
+        store.add_documents(documents, embeddings=embeddings)
+        return name, (time.perf_counter_ns() - start_ns) / 1e9
+    except Exception as e:
+        print(f"Error indexing in {name}: {str(e)}")
+        return name, -1
+
+
+def ingest_document(filename, data, saved_file=None):
+    """
+    Extract, split, embed and index a PDF in all vector stores
     
-    if file.filename == '':
-        return jsonify({"success": False, "message": "No file selected"})
+    Args:
+        filename: Original name of the uploaded file
+        data: PDF content
+        saved_file: Future for the path of the copy saved on disk, which
+            parallel extraction workers read instead of the bytes
         
-    if not file.filename.lower().endswith('.pdf'):
-        return jsonify({"success": False, "message": "Only PDF files are supported"})
-    
+    Returns:
+        dict: Upload response payload with performance metrics for each database
+    """
     try:
-        # Save the uploaded file
-        file_path = save_uploaded_file(file)
-        
-        # Extract text from PDF
-        text = extract_text_from_pdf(file_path)
+        chunk_cache_key = hashlib.sha256(data).hexdigest()
+        document_chunks = get_cached_chunks(chunk_cache_key)
         
-        if not text or len(text) < 10:
-            return jsonify({"success": False, "message": "Could not extract text from the PDF file"})
+        if document_chunks is None:
+            saved_path = None
+            if saved_file is not None:
+                try:
+                    saved_path = saved_file.result()
+                except Exception as e:
+                    print(f"⚠️ Could not save upload, extracting in-process: {str(e)}")
             
-        # Split text into chunks
-        document_chunks = split_text(text)
-        
-        if not document_chunks or len(document_chunks) == 0:
-            return jsonify({"success": False, "message": "Failed to process document into chunks"})
+            # Extract text from PDF
+            text = extract_text_from_pdf(data, path=saved_path)
+            
+            if not text or len(text) < 10:
+                return {"success": False, "message": "Could not extract text from the PDF file"}
+                
+            # Split text into chunks; the chunks hold their own copies, so the
+            # full text is released before embedding and indexing
+            document_chunks = split_text(text)
+            del text
+            
+            if not document_chunks or len(document_chunks) == 0:
+                return {"success": False, "message": "Failed to process document into chunks"}
+            
+            cache_chunks(chunk_cache_key, document_chunks)
             
         # Initialize timing dictionary
         indexing_times = {
@@ -132,70 +485,197 @@ def upload():
             "milvus": -1
         }
         
-        # Time how long it takes to add documents to each vector store
-        # FAISS
-        start_time = time.time()
-        faiss_store.add_documents(document_chunks)
-        indexing_times["faiss"] = time.time() - start_time
+        # Embed all chunks once (cached on disk) and share the vectors with
+        # every store. They are L2-normalized here once, so every store holds
+        # unit vectors and cosine, inner product and L2 rankings all agree.
+        # The vectors stay one float32 array; stores whose clients need
+        # Python lists convert at their own boundary.
+        embeddings = embedding_cache.embed_documents([chunk.page_content for chunk in document_chunks])
+        embeddings = normalize_embeddings(embeddings)
         
-        # ChromaDB
-        start_time = time.time()
-        chroma_store.add_documents(document_chunks)
-        indexing_times["chroma"] = time.time() - start_time
+        # Collect the vector stores that should receive the documents
+        stores = [(name, DB_MAP[name]) for name in AVAILABLE_DBS]
         
-        # Weaviate (if available)
-        if weaviate_available and weaviate_store:
-            start_time = time.time()
-            weaviate_store.add_documents(document_chunks)
-            indexing_times["weaviate"] = time.time() - start_time
-            
-        # MongoDB
-        try:
-            start_time = time.time()
-            mongo_store.add_documents(document_chunks)
-            indexing_times["mongo"] = time.time() - start_time
-        except Exception as e:
-            print(f"Error indexing in MongoDB: {str(e)}")
-            
-        # pgvector
-        try:
-            start_time = time.time()
-            pgvector_store.add_documents(document_chunks)
-            indexing_times["pgvector"] = time.time() - start_time
-        except Exception as e:
-            print(f"Error indexing in pgvector: {str(e)}")
-            
-        # Milvus (if available)
-        if milvus_available and milvus_store:
-            try:
-                start_time = time.time()
-                milvus_store.add_documents(document_chunks)
-                indexing_times["milvus"] = time.time() - start_time
-            except Exception as e:
-                print(f"Error indexing in Milvus: {str(e)}")
+        # Index into all vector stores concurrently; each store is independent
+        # and the work is dominated by network/disk I/O
+        futures = [
+            io_executor.submit(index_documents, name, store, document_chunks, embeddings)
+            for name, store in stores
+        ]
+        failed = []
+        for future in futures:
+            name, elapsed = future.result()
+            indexing_times[name] = elapsed
+            if elapsed < 0:
+                failed.append(DB_NAMES[name])
+        
+        # Cached RAG responses no longer reflect the indexed documents
+        for rag_cache in rag_caches.values():
+            rag_cache.clear()
         
         # Return success with timing metrics
-        return jsonify({
+        return {
             "success": True,
-            "message": "Document processed successfully",
+            "message": (
+                f"Document processed, but indexing failed in {', '.join(failed)}"
+                if failed else "Document processed successfully"
+            ),
             "document": {
-                "filename": file.filename,
+                "filename": filename,
                 "chunk_count": len(document_chunks),
                 "indexing_times": indexing_times,
                 "available_dbs": {
-                    "faiss": True,
-                    "chroma": True,
-                    "weaviate": weaviate_available,
+                    "faiss": indexing_times["faiss"] >= 0,
+                    "chroma": indexing_times["chroma"] >= 0,
+                    "weaviate": indexing_times["weaviate"] >= 0,
                     "mongo": indexing_times["mongo"] >= 0,
                     "pgvector": indexing_times["pgvector"] >= 0,
-                    "milvus": milvus_available and indexing_times["milvus"] >= 0
+                    "milvus": indexing_times["milvus"] >= 0
                 }
             }
-        })
+        }
     
     except Exception as e:
         print(f"Error processing document: {str(e)}")
-        return jsonify({"success": False, "message": f"Error: {str(e)}"})
+        return {"success": False, "message": f"Error: {str(e)}"}
+
+
+def run_upload_job(job_id, filename, data, saved_file=None):
+    """Run a queued upload and record its outcome"""
+    with upload_jobs_lock:
+        upload_jobs[job_id]["status"] = "processing"
+    
+    result = ingest_document(filename, data, saved_file)
+    
+    # The job is only marked done once every vector store upsert has finished
+    with upload_jobs_lock:
+        upload_jobs[job_id]["status"] = "done" if result["success"] else "failed"
+        upload_jobs[job_id]["result"] = result
+
+
+@app.route('/api/upload', methods=['POST'])
+def upload():
+    """
+    Handle document upload, process text, and index in all vector stores
+    Returns performance metrics for each database
+    
+    With the form field `background=true`, responds immediately with HTTP 202
+    and a job id; poll /api/upload/<job_id> for the result.
+    """
+    if 'file' not in request.files:
+        return jsonify({"success": False, "message": "No file provided"})
+        
+    file = request.files['file']
+    
+    if file.filename == '':
+        return jsonify({"success": False, "message": "No file selected"})
+        
+    if not file.filename.lower().endswith('.pdf'):
+        return jsonify({"success": False, "message": "Only PDF files are supported"})
+    
+    # Read the upload into memory and extract text from the bytes directly;
+    # keeping a copy on disk happens in the background
+    data = file.read()
+    saved_file = io_executor.submit(save_uploaded_file, file, upload_dir=UPLOAD_DIR, data=data)
+    
+    if request.form.get('background') == 'true':
+        job_id = uuid.uuid4().hex
+        with upload_jobs_lock:
+            upload_jobs[job_id] = {"status": "queued"}
+            # Forget the oldest jobs once the history is full
+            while len(upload_jobs) > UPLOAD_JOB_HISTORY:
+                upload_jobs.popitem(last=False)
+        ingest_executor.submit(run_upload_job, job_id, file.filename, data, saved_file)
+        return jsonify({"success": True, "job_id": job_id, "status": "queued"}), 202
+    
+    # Run on the ingest pool, so foreground and background uploads share one
+    # bound on concurrent extraction and embedding
+    return jsonify(ingest_executor.submit(ingest_document, file.filename, data, saved_file).result())
+
+
+@app.route('/api/upload/<job_id>', methods=['GET'])
+def upload_status(job_id):
+    """Return the status of a background upload, and its result once finished"""
+    with upload_jobs_lock:
+        job = upload_jobs.get(job_id)
+        job = dict(job) if job else None
+    
+    if job is None:
+        return jsonify({"success": False, "message": "Unknown upload job"})
+    
+    return jsonify({"success": True, "job_id": job_id, **job})
+
+
+def query_database(db, query, query_embedding=None):
+    """
+    Query a single vector database for the comparison view
+    
+    Returns:
+        tuple: (database key, result dict with timing and documents, or an error)
+    """
+    try:
+        query_time, results = DB_MAP[db].query(query, query_embedding=query_embedding)
+        vector_store_name = DB_NAMES[db]
+        
+        # Format results for this database
+        formatted_results = format_results(query_time, results)
+        return db, {
+            "name": vector_store_name,
+            "query_time": query_time,
+            "retrieved_docs": formatted_results["results"]
+        }
+    except Exception as db_error:
+        print(f"Error querying {db}: {str(db_error)}")
+        return db, {
+            "name": db,
+            "error": str(db_error)
+        }
+
+
+def build_rag_context(contents):
+    """
+    Build the prompt context from retrieved chunks in relevance order
+    
+    Keeps at most RAG_CONTEXT_DOCS chunks, skips chunks whose text is
+    already contained in an included chunk (e.g. the same PDF uploaded
+    twice) and truncates the context to RAG_MAX_CONTEXT_CHARS characters.
+    Neighbouring splits that only share their overlap region are both kept.
+    """
+    parts = []
+    remaining = RAG_MAX_CONTEXT_CHARS
+    
+    for content in contents:
+        if len(parts) >= RAG_CONTEXT_DOCS or remaining <= 0:
+            break
+        if any(content in part for part in parts):
+            continue
+        
+        content = content[:remaining]
+        parts.append(content)
+        remaining -= len(content)
+    
+    return "\n\n".join(parts)
+
+
+def generate_rag_response(query, contents):
+    """Generate an answer to the query from the retrieved document contents"""
+    context = build_rag_context(contents)
+    cache_key = hashlib.sha256(f"{query}\0{context}".encode("utf-8")).digest()
+    
+    with rag_answer_cache_lock:
+        if cache_key in rag_answer_cache:
+            rag_answer_cache.move_to_end(cache_key)
+            return rag_answer_cache[cache_key]
+    
+    prompt = RAG_PROMPT_TEMPLATE.format(query=query, context=context)
+    response = rag_model.generate_content(prompt)
+    
+    with rag_answer_cache_lock:
+        rag_answer_cache[cache_key] = response.text
+        if len(rag_answer_cache) > RAG_ANSWER_CACHE_SIZE:
+            rag_answer_cache.popitem(last=False)
+    
+    return response.text
 
 
 @app.route('/api/rag', methods=['POST'])
@@ -212,160 +692,89 @@ def rag_query():
         return jsonify({"success": False, "message": "No query provided"})
     
     try:
+        # Embed the query once and share the vector with every database
+        query_embedding = embed_query(query)
+        
+        # Serve paraphrases of previously answered queries from the semantic cache
+        rag_cache = rag_caches.get("compare_all" if compare_all else db_type)
+        if rag_cache is not None:
+            cached_response = rag_cache.get(query_embedding)
+            if cached_response is not None:
+                return jsonify({**cached_response, "query": query})
+        
         # If compare_all is True, we'll query all available databases and return all results
         if compare_all:
             all_results = {}
-            # Get the list of available databases
-            available_dbs = ["faiss", "chroma"]
-            if weaviate_available:
-                available_dbs.append("weaviate")
-            if mongo_store.initialized:
-                available_dbs.append("mongo")
-            if pgvector_store.initialized:
-                available_dbs.append("pgvector")
-            if milvus_available and milvus_store.initialized:
-                available_dbs.append("milvus")
+            # Query all available databases concurrently, keeping results in
+            # the same order as AVAILABLE_DBS
+            db_results = list(io_executor.map(
+                lambda db: query_database(db, query, query_embedding),
+                AVAILABLE_DBS
+            ))
+            all_results.update(db_results)
             
-            # Query each available database
-            for db in available_dbs:
-                try:
-                    if db == 'faiss':
-                        query_time, results = faiss_store.query(query)
-                        vector_store_name = "FAISS"
-                    elif db == 'chroma':
-                        query_time, results = chroma_store.query(query)
-                        vector_store_name = "ChromaDB"
-                    elif db == 'weaviate':
-                        query_time, results = weaviate_store.query(query)
-                        vector_store_name = "Weaviate"
-                    elif db == 'mongo':
-                        query_time, results = mongo_store.query(query)
-                        vector_store_name = "MongoDB"
-                    elif db == 'pgvector':
-                        query_time, results = pgvector_store.query(query)
-                        vector_store_name = "pgvector"
-                    elif db == 'milvus':
-                        query_time, results = milvus_store.query(query)
-                        vector_store_name = "Milvus"
-                    
-                    # Format results for this database
-                    formatted_results = format_results(query_time, results)
-                    all_results[db] = {
-                        "name": vector_store_name,
-                        "query_time": query_time,
-                        "retrieved_docs": formatted_results["results"]
-                    }
-                except Exception as db_error:
-                    print(f"Error querying {db}: {str(db_error)}")
-                    all_results[db] = {
-                        "name": db,
-                        "error": str(db_error)
-                    }
-            
-            # Use Gemini model to generate a response based on the best results
-            # We'll use the database with most results or lowest query time if tied
-            best_db = None
-            max_results = -1
-            min_time = float('inf')
-            
-            # Determine the fastest database (lowest query time)
-            for db, result in all_results.items():
-                if "query_time" in result and result["query_time"] < min_time and "retrieved_docs" in result and len(result["retrieved_docs"]) > 0:
-                    min_time = result["query_time"]
-                    max_results = len(result["retrieved_docs"])
-                    best_db = db
-            
-            # If no database has results with valid times, fall back to most results
-            if best_db is None:
-                for db, result in all_results.items():
-                    if "retrieved_docs" in result and len(result["retrieved_docs"]) > max_results:
-                        max_results = len(result["retrieved_docs"])
-                        best_db = db
+            # Answer from the fastest database that returned documents; if
+            # none did, report the first one that answered without an error
+            answered = [(db, result) for db, result in db_results if "retrieved_docs" in result]
+            with_docs = [(db, result) for db, result in answered if result["retrieved_docs"]]
+            if with_docs:
+                best_db = min(with_docs, key=lambda item: item[1]["query_time"])[0]
+            else:
+                best_db = answered[0][0] if answered else None
             
             # If we have a best DB with results, generate RAG response
             rag_response = "No results found in any database."
-            if best_db and max_results > 0:
-                if "retrieved_docs" in all_results[best_db]:
-                    # Extract content from documents
-                    docs = [doc["content"] for doc in all_results[best_db]["retrieved_docs"]]
-                    context = "\n\n".join(docs)
-                    
-                    print(f"Generating RAG response using {best_db} with {max_results} documents")
-                    
-                    prompt = f"""
-                    Based on the following information, please answer the query: {query}
-                    
-                    Context information:
-                    {context}
-                    
-                    Please provide a concise and accurate answer based only on the context provided.
-                    If the context doesn't contain relevant information, state that you don't have enough information to answer.
-                    """
-                    
-                    response = model.generate_content(prompt)
-                    rag_response = response.text
+            if with_docs:
+                # Extract content from documents
+                docs = [doc["content"] for doc in all_results[best_db]["retrieved_docs"]]
+                
+                print(f"Generating RAG response using {best_db} with {len(docs)} documents")
+                
+                rag_response = generate_rag_response(query, docs)
             
             # Return comparison results
-            return jsonify({
+            response_data = {
                 "success": True,
                 "query": query,
                 "compare_all": True,
                 "results": all_results,
                 "rag_response": rag_response,
                 "best_db": best_db
-            })
+            }
+            # Skip the cache if any database failed or none found documents,
+            # so a later paraphrase retries instead of replaying the gap
+            if with_docs and len(answered) == len(db_results):
+                rag_cache.put(query_embedding, response_data)
+            return jsonify(response_data)
         
         # Otherwise, use the single selected database as before
         else:
-            if db_type == 'faiss':
-                query_time, results = faiss_store.query(query)
-                vector_store_name = "FAISS"
-            elif db_type == 'chroma':
-                query_time, results = chroma_store.query(query)
-                vector_store_name = "ChromaDB"
-            elif db_type == 'weaviate':
-                query_time, results = weaviate_store.query(query)
-                vector_store_name = "Weaviate"
-            elif db_type == 'mongo':
-                query_time, results = mongo_store.query(query)
-                vector_store_name = "MongoDB"
-            elif db_type == 'pgvector':
-                query_time, results = pgvector_store.query(query)
-                vector_store_name = "pgvector"
-            elif db_type == 'milvus':
-                query_time, results = milvus_store.query(query)
-                vector_store_name = "Milvus"
-            else:
+            store = DB_MAP.get(db_type)
+            if store is None:
                 return jsonify({"success": False, "message": "Invalid database type"})
+            
+            query_time, results = store.query(query, query_embedding=query_embedding)
                 
             # Format results for display
             formatted_results = format_results(query_time, results)
             
             # Use Gemini model to generate a response based on retrieved context
-            context = "\n\n".join([doc.page_content for doc in results])
-            
-            prompt = f"""
-            Based on the following information, please answer the query: {query}
-            
-            Context information:
-            {context}
-            
-            Please provide a concise and accurate answer based only on the context provided.
-            If the context doesn't contain relevant information, state that you don't have enough information to answer.
-            """
-            
-            response = model.generate_content(prompt)
-            rag_response = response.text
+            rag_response = generate_rag_response(query, [doc.page_content for doc in results])
             
             # Return the results
-            return jsonify({
+            response_data = {
                 "success": True,
                 "query": query,
                 "db_type": db_type,
                 "query_time": query_time,
                 "rag_response": rag_response,
                 "retrieved_docs": formatted_results["results"]
-            })
+            }
+            # Stores report failures as an empty result, so only answers
+            # grounded in retrieved documents are cached
+            if results:
+                rag_cache.put(query_embedding, response_data)
+            return jsonify(response_data)
     
     except Exception as e:
         print(f"Error processing RAG query: {str(e)}")
@@ -375,15 +784,9 @@ def rag_query():
 @app.route('/api/available-dbs', methods=['GET'])
 def available_dbs():
     """Return the list of available vector databases"""
-    dbs = ["faiss", "chroma", "mongo", "pgvector"]
-    if weaviate_available:
-        dbs.append("weaviate")
-    if milvus_available:
-        dbs.append("milvus")
-    
     return jsonify({
         "success": True,
-        "available_databases": dbs
+        "available_databases": list(AVAILABLE_DBS)
     })
 
 
@@ -394,4 +797,8 @@ def test():
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    # Development server only; see the README for running under gunicorn
+    # Extraction workers import the entry script, which here would repeat
+    # the whole startup in each of them, so PDFs are extracted in-process
+    rag.document.PDF_EXTRACTION_WORKERS = 1
+    app.run(debug=os.getenv("FLASK_DEBUG") == "1", threaded=True)
\ No newline at end of file
@@ -0,0 +1,116 @@
+import threading
+import time
+from typing import Any, List, Optional
+import numpy as np
+
+class ProximityCache:
+    def __init__(self, capacity: int = 256, threshold: float = 0.95, ttl: float = None):
+        """
+        Approximate cache keyed by embedding vectors
+
+        A lookup hits when the cosine similarity between the query embedding
+        and a stored key is at least `threshold`. When the cache is full the
+        least recently used entry is evicted. Entries older than `ttl`
+        seconds are never returned.
+        
+        Keys are kept L2-normalized in one contiguous float32 matrix, so a
+        lookup is a single BLAS matrix-vector product. The matrix grows by
+        doubling to avoid copying it on every insert.
+
+        Args:
+            capacity: Maximum number of entries to keep
+            threshold: Minimum cosine similarity for a cache hit
+            ttl: Maximum age of an entry in seconds (no expiry if None)
+        """
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self.keys = None
+        self.size = 0
+        self.values: List[Any] = []
+        self.last_used: List[int] = []
+        self.created_at: List[float] = []
+        self._tick = 0
+        self._lock = threading.Lock()
+
+    def _normalize(self, embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+        return vector
+
+    def get(self, embedding) -> Optional[Any]:
+        """
+        Look up the value stored for the closest embedding
+
+        Args:
+            embedding: Query embedding
+
+        Returns:
+            The cached value, or None if no key is similar enough
+        """
+        query = self._normalize(embedding)
+
+        with self._lock:
+            if self.size == 0:
+                return None
+
+            similarities = self.keys[:self.size] @ query
+            # Expired entries never match, so an older near-duplicate can't
+            # hide a fresh entry that is also above the threshold
+            if self.ttl is not None:
+                expired = time.monotonic() - np.asarray(self.created_at) > self.ttl
+                similarities[expired] = -np.inf
+            index = int(np.argmax(similarities))
+            if similarities[index] < self.threshold:
+                return None
+
+            self._tick += 1
+            self.last_used[index] = self._tick
+            return self.values[index]
+
+    def put(self, embedding, value: Any) -> None:
+        """
+        Store a value under an embedding, evicting the least recently used entry if full
+
+        Args:
+            embedding: Key embedding
+            value: Value to cache
+        """
+        if self.capacity <= 0:
+            return
+
+        key = self._normalize(embedding)
+        now = time.monotonic()
+
+        with self._lock:
+            self._tick += 1
+
+            if self.size < self.capacity:
+                if self.keys is None:
+                    self.keys = np.empty((min(16, self.capacity), key.shape[0]), dtype=np.float32)
+                elif self.size == self.keys.shape[0]:
+                    grown = np.empty((min(2 * self.size, self.capacity), key.shape[0]), dtype=np.float32)
+                    grown[:self.size] = self.keys
+                    self.keys = grown
+                self.keys[self.size] = key
+                self.size += 1
+                self.values.append(value)
+                self.last_used.append(self._tick)
+                self.created_at.append(now)
+            else:
+                index = int(np.argmin(self.last_used))
+                self.keys[index] = key
+                self.values[index] = value
+                self.last_used[index] = self._tick
+                self.created_at[index] = now
+
+    def clear(self) -> None:
+        """Remove all entries from the cache"""
+        with self._lock:
+            self.keys = None
+            self.size = 0
+            self.values = []
+            self.last_used = []
+            self.created_at = []
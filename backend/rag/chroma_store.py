@@ -1,50 +1,72 @@
 import time
 import os
+import uuid
 from typing import List, Dict, Tuple
 from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
 from langchain.schema import Document
+from .utils import to_float_list, get_default_embeddings
 
 class ChromaVectorStore:
     def __init__(self, embedding_model=None):
         """Initialize the Chroma vector store with embedding model"""
-        self.embedding_model = embedding_model or OpenAIEmbeddings()
+        self.embedding_model = embedding_model or get_default_embeddings()
         self.vectorstore = None
-        self.persist_directory = os.path.join("chroma_db")
+        # Next to the app, independent of the working directory
+        self.persist_directory = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chroma_db")
         os.makedirs(self.persist_directory, exist_ok=True)
         
-    def add_documents(self, documents: List[Document]) -> float:
+    def add_documents(self, documents: List[Document], embeddings: List[List[float]] = None) -> float:
         """
         Add documents to Chroma vector store
         
         Args:
             documents: List of documents to add
+            embeddings: Precomputed embeddings, one per document (optional)
             
         Returns:
             float: Time taken to add documents
         """
-        start_time = time.time()
+        start_time = time.perf_counter()
         
-        # Create Chroma vectorstore from documents
-        self.vectorstore = Chroma.from_documents(
-            documents,
-            self.embedding_model,
-            persist_directory=self.persist_directory
-        )
+        # Open the persistent collection once and add to it incrementally
+        if self.vectorstore is None:
+            self.vectorstore = Chroma(
+                persist_directory=self.persist_directory,
+                embedding_function=self.embedding_model
+            )
+        
+        if embeddings is not None:
+            embeddings = to_float_list(embeddings)
+            # Chroma rejects empty metadata dicts, so documents with and
+            # without metadata go in separate upserts
+            with_metadata = [i for i, doc in enumerate(documents) if doc.metadata]
+            without_metadata = [i for i, doc in enumerate(documents) if not doc.metadata]
+            for indices, has_metadata in ((with_metadata, True), (without_metadata, False)):
+                if not indices:
+                    continue
+                self.vectorstore._collection.upsert(
+                    ids=[str(uuid.uuid4()) for _ in indices],
+                    embeddings=[embeddings[i] for i in indices],
+                    documents=[documents[i].page_content for i in indices],
+                    metadatas=[documents[i].metadata for i in indices] if has_metadata else None
+                )
+        else:
+            self.vectorstore.add_documents(documents)
         
-        # Persist the vectorstore
-        self.vectorstore.persist()
+        # No persist() call: since Chroma 0.4 the persistent client writes
+        # every change to disk itself
         
-        end_time = time.time()
+        end_time = time.perf_counter()
         return end_time - start_time
         
-    def query(self, query_text: str, top_k: int = 5) -> Tuple[float, List[Document]]:
+    def query(self, query_text: str, top_k: int = 5, query_embedding: List[float] = None) -> Tuple[float, List[Document]]:
         """
         Query the Chroma vector store
         
         Args:
             query_text: Query text
             top_k: Number of results to return
+            query_embedding: Precomputed embedding of the query text (optional)
             
         Returns:
             Tuple[float, List[Document]]: Time taken and results
@@ -59,10 +81,13 @@ class ChromaVectorStore:
             except:
                 return 0.0, []
                 
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         # Search for similar documents
-        results = self.vectorstore.similarity_search(query_text, k=top_k)
+        if query_embedding is not None:
+            results = self.vectorstore.similarity_search_by_vector(to_float_list(query_embedding), k=top_k)
+        else:
+            results = self.vectorstore.similarity_search(query_text, k=top_k)
         
-        end_time = time.time()
+        end_time = time.perf_counter()
         return end_time - start_time, results
\ No newline at end of file
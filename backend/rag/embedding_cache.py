@@ -0,0 +1,142 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import List
+import numpy as np
+
+# Limits for one embedding request: the Gemini API accepts at most 100
+# texts per batch call, and the byte budget stays below its 4 MiB request
+# payload cap
+EMBED_BATCH_SIZE = 100
+EMBED_BATCH_BYTES = 3_500_000
+
+def _batches(texts: List[str]):
+    """Yield slices of texts bounded by both item count and encoded size"""
+    batch = []
+    batch_bytes = 0
+    for text in texts:
+        text_bytes = len(text.encode("utf-8"))
+        if batch and (len(batch) >= EMBED_BATCH_SIZE or batch_bytes + text_bytes > EMBED_BATCH_BYTES):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(text)
+        batch_bytes += text_bytes
+    if batch:
+        yield batch
+
+class EmbeddingCache:
+    def __init__(self, embedding_model, model_name: str, path: str = "embedding_cache.sqlite3"):
+        """
+        Persistent cache of document embeddings keyed by a hash of the text
+
+        Args:
+            embedding_model: Model used to embed texts that are not cached yet
+            model_name: Provider and model identifier, part of every key so
+                switching models never returns stale vectors
+            path: Location of the SQLite database file
+        """
+        self.embedding_model = embedding_model
+        self.model_name = model_name
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection, commit on success and always close it"""
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _key(self, text: str, kind: str = "document") -> str:
+        # Query and document embeddings can differ for the same text
+        # (task-specific embeddings), so they are cached separately
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """
+        Embed a query, calling the model only if it is not cached
+
+        Args:
+            text: Query text
+
+        Returns:
+            np.ndarray: Query embedding as a contiguous float32 vector
+        """
+        key = self._key(text, kind="query")
+
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT vector FROM embeddings WHERE hash = ?", (key,)).fetchone()
+        if row is not None:
+            return np.frombuffer(row[0], dtype=np.float32)
+
+        vector = np.asarray(self.embedding_model.embed_query(text), dtype=np.float32)
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO embeddings (hash, vector) VALUES (?, ?)",
+                (key, vector.tobytes())
+            )
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts, calling the model only for texts that are not cached
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            List[List[float]]: One embedding per input text, in order
+        """
+        keys = [self._key(text) for text in texts]
+        vectors = {}
+
+        with self._lock, self._connect() as conn:
+            unique_keys = list(dict.fromkeys(keys))
+            # Stay below SQLite's bound-parameter limit
+            for i in range(0, len(unique_keys), 500):
+                batch = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE hash IN ({placeholders})",
+                    batch
+                )
+                for key, blob in rows:
+                    vectors[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+        # Embed the distinct missing texts in as few batched calls as possible
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+
+        if missing:
+            new_vectors = []
+            for batch in _batches(list(missing.values())):
+                new_vectors.extend(self.embedding_model.embed_documents(batch))
+            rows = []
+            for key, vector in zip(missing.keys(), new_vectors):
+                vectors[key] = list(vector)
+                rows.append((key, np.asarray(vector, dtype=np.float32).tobytes()))
+
+            with self._lock, self._connect() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (hash, vector) VALUES (?, ?)",
+                    rows
+                )
+
+        return [vectors[key] for key in keys]
@@ -1,44 +1,107 @@
 import time
 import os
+import uuid
 from typing import List, Dict, Tuple
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
+from langchain_community.vectorstores.utils import DistanceStrategy
 from langchain.schema import Document
+from .utils import get_default_embeddings, normalize_embeddings
+
+# Collections at least this large use an approximate HNSW index with 8-bit
+# scalar-quantized vectors (a quarter of the float32 memory); below it an
+# exact float32 flat scan is small and fast enough. Vectors are unit length,
+# so every index ranks by inner product, which equals cosine similarity.
+HNSW_MIN_DOCUMENTS = 10_000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+# Searches from concurrent requests already run on separate threads, so each
+# one gets a small share of OpenMP threads instead of all cores
+FAISS_OMP_THREADS = int(os.getenv("FAISS_OMP_THREADS", str(max(1, (os.cpu_count() or 1) // 4))))
+faiss.omp_set_num_threads(FAISS_OMP_THREADS)
 
 class FAISSVectorStore:
     def __init__(self, embedding_model=None):
         """Initialize the FAISS vector store with embedding model"""
-        self.embedding_model = embedding_model or OpenAIEmbeddings()
+        self.embedding_model = embedding_model or get_default_embeddings()
         self.vectorstore = None
+        self.use_hnsw = os.getenv("FAISS_HNSW", "1") == "1"
+        self.use_sq8 = os.getenv("FAISS_SQ8", "1") == "1"
+    
+    def _build_index(self, vectors: np.ndarray):
+        """Create and fill a FAISS index suited to the number of vectors"""
+        dim = vectors.shape[1]
+        
+        metric = faiss.METRIC_INNER_PRODUCT
+        
+        if len(vectors) < HNSW_MIN_DOCUMENTS:
+            index = faiss.IndexFlatIP(dim)
+        elif self.use_hnsw:
+            if self.use_sq8:
+                index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, HNSW_M, metric)
+            else:
+                index = faiss.IndexHNSWFlat(dim, HNSW_M, metric)
+            index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+        elif self.use_sq8:
+            index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, metric)
+        else:
+            index = faiss.IndexFlatIP(dim)
         
-    def add_documents(self, documents: List[Document]) -> float:
+        # Quantizers learn per-dimension ranges from the data being indexed
+        if not index.is_trained:
+            index.train(vectors)
+        index.add(vectors)
+        return index
+        
+    def add_documents(self, documents: List[Document], embeddings: List[List[float]] = None) -> float:
         """
         Add documents to FAISS vector store
         
         Args:
             documents: List of documents to add
+            embeddings: Precomputed embeddings, one per document (optional)
             
         Returns:
             float: Time taken to add documents
         """
-        start_time = time.time()
+        start_time = time.perf_counter()
+        
+        # Use the precomputed embeddings or get them from the model in one
+        # batched call
+        if embeddings is None:
+            embeddings = self.embedding_model.embed_documents([doc.page_content for doc in documents])
         
-        # Create FAISS vectorstore from documents
-        self.vectorstore = FAISS.from_documents(
-            documents,
-            self.embedding_model
+        # Pack the unit vectors into one contiguous float32 matrix and add it
+        # to the index in a single call. They are normalized here, so the
+        # wrapper is not asked to normalize again.
+        vectors = np.ascontiguousarray(normalize_embeddings(embeddings))
+        index = self._build_index(vectors)
+        
+        ids = [str(uuid.uuid4()) for _ in documents]
+        self.vectorstore = FAISS(
+            self.embedding_model,
+            index,
+            InMemoryDocstore(dict(zip(ids, documents))),
+            dict(enumerate(ids)),
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
         )
         
-        end_time = time.time()
+        end_time = time.perf_counter()
         return end_time - start_time
         
-    def query(self, query_text: str, top_k: int = 5) -> Tuple[float, List[Document]]:
+    def query(self, query_text: str, top_k: int = 5, query_embedding: List[float] = None) -> Tuple[float, List[Document]]:
         """
         Query the FAISS vector store
         
         Args:
             query_text: Query text
             top_k: Number of results to return
+            query_embedding: Precomputed embedding of the query text (optional)
             
         Returns:
             Tuple[float, List[Document]]: Time taken and results
@@ -46,10 +109,15 @@ class FAISSVectorStore:
         if self.vectorstore is None:
             return 0.0, []
             
-        start_time = time.time()
+        start_time = time.perf_counter()
         
-        # Search for similar documents
-        results = self.vectorstore.similarity_search(query_text, k=top_k)
+        # Search with a unit-length query vector, so inner product scores
+        # are cosine similarities
+        if query_embedding is None:
+            query_embedding = self.embedding_model.embed_query(query_text)
+        results = self.vectorstore.similarity_search_by_vector(
+            normalize_embeddings(query_embedding).tolist(), k=top_k
+        )
         
-        end_time = time.time()
+        end_time = time.perf_counter()
         return end_time - start_time, results
\ No newline at end of file
@@ -2,6 +2,7 @@ import time
 import os
 from typing import List, Tuple
 from langchain.schema import Document
+from .utils import to_float_list
 from pymilvus import (
     connections,
     utility,
@@ -12,11 +13,23 @@ from pymilvus import (
     MilvusException
 )
 
+# Index for new collections: IVF_SQ8 stores each vector as 8-bit codes (a
+# quarter of IVF_FLAT's memory) with the same inverted-list search
+MILVUS_INDEX_TYPE = os.getenv("MILVUS_INDEX_TYPE", "IVF_SQ8")
+
+SEARCH_PARAMS = {
+    "metric_type": "COSINE",
+    "params": {"nprobe": 10}
+}
+OUTPUT_FIELDS = ["content", "metadata"]
+
 class MilvusVectorStore:
-    def __init__(self, embedding_model=None):
+    def __init__(self, embedding_model=None, embedding_dim: int = None):
         self.embedding_model = embedding_model
+        self.embedding_dim = embedding_dim
         self.initialized = False
         self.collection = None
+        self.loaded = False
         
         try:
             # Get Milvus credentials from environment variables
@@ -35,9 +48,8 @@ class MilvusVectorStore:
             # Create collection if it doesn't exist
             collection_name = "document_chunks"
             if not utility.has_collection(collection_name):
-                # Get embedding dimension from the model
-                test_embedding = self.embedding_model.embed_query("test")
-                embedding_dim = len(test_embedding)
+                # Get embedding dimension from the model unless it is known
+                embedding_dim = self.embedding_dim or len(self.embedding_model.embed_query("test"))
                 
                 # Define schema
                 fields = [
@@ -54,23 +66,32 @@ class MilvusVectorStore:
                 # Create index
                 index_params = {
                     "metric_type": "COSINE",
-                    "index_type": "IVF_FLAT",
+                    "index_type": MILVUS_INDEX_TYPE,
                     "params": {"nlist": 1024}
                 }
                 self.collection.create_index(field_name="embedding", index_params=index_params)
             else:
                 self.collection = Collection(collection_name)
                 # Verify embedding dimension matches
-                test_embedding = self.embedding_model.embed_query("test")
+                embedding_dim = self.embedding_dim or len(self.embedding_model.embed_query("test"))
                 schema = self.collection.schema
                 for field in schema.fields:
                     if field.name == "embedding":
-                        if field.dim != len(test_embedding):
+                        if field.dim != embedding_dim:
                             # Drop and recreate collection with correct dimension
                             utility.drop_collection(collection_name)
-                            self.__init__(self.embedding_model)
+                            self.__init__(self.embedding_model, embedding_dim)
                             return
             
+            # Load the collection into memory now, while the app is starting
+            # up, rather than on the first search; it stays loaded and new
+            # inserts become searchable without reloading
+            try:
+                self.collection.load()
+                self.loaded = True
+            except MilvusException as load_error:
+                print(f"⚠️ Could not load Milvus collection yet, loading on first query: {str(load_error)}")
+            
             self.initialized = True
             print("✅ Successfully connected to Milvus")
             
@@ -81,80 +102,76 @@ class MilvusVectorStore:
             print(f"❌ Error initializing Milvus: {str(e)}")
             self.initialized = False
     
-    def add_documents(self, documents: List[Document]) -> float:
+    def add_documents(self, documents: List[Document], embeddings: List[List[float]] = None) -> float:
         if not self.initialized:
-            print("❌ Cannot add documents: Milvus not initialized")
-            return 0.0
+            raise RuntimeError("Cannot add documents: Milvus not initialized")
             
-        start_time = time.time()
+        start_time = time.perf_counter()
         try:
-            # Prepare data for insertion
-            contents = []
-            metadatas = []
-            embeddings = []
-            
-            for doc in documents:
-                contents.append(doc.page_content)
-                metadatas.append(doc.metadata if doc.metadata else {})
-                embeddings.append(self.embedding_model.embed_query(doc.page_content))
+            # Prepare column-wise data for insertion
+            contents = [doc.page_content for doc in documents]
+            metadatas = [doc.metadata if doc.metadata else {} for doc in documents]
+            if embeddings is not None:
+                vectors = to_float_list(embeddings)
+            else:
+                vectors = self.embedding_model.embed_documents(contents)
             
-            # Insert data
+            # Insert data. No explicit flush: inserted rows are searchable in
+            # growing segments, and Milvus seals segments on its own; a manual
+            # flush costs a slow server round-trip and creates small segments
             entities = [
                 contents,
                 metadatas,
-                embeddings
+                vectors
             ]
             
             self.collection.insert(entities)
-            self.collection.flush()
             
             print(f"✅ Added {len(documents)} documents to Milvus")
-            return time.time() - start_time
+            return time.perf_counter() - start_time
             
         except Exception as e:
             print(f"❌ Error adding documents to Milvus: {str(e)}")
-            return 0.0
+            raise
 
-    def query(self, query_text: str, top_k: int = 5) -> Tuple[float, List[Document]]:
+    def query(self, query_text: str, top_k: int = 5, query_embedding: List[float] = None) -> Tuple[float, List[Document]]:
         if not self.initialized:
             print("❌ Cannot query: Milvus not initialized")
             return 0.0, []
             
-        start_time = time.time()
+        start_time = time.perf_counter()
         try:
-            # Get query embedding
-            query_emb = self.embedding_model.embed_query(query_text)
+            # Get query embedding unless the caller already computed it
+            if query_embedding is not None:
+                query_emb = to_float_list(query_embedding)
+            else:
+                query_emb = self.embedding_model.embed_query(query_text)
             
-            # Load collection into memory
-            self.collection.load()
+            # Load the collection if warming it up at startup failed
+            if not self.loaded:
+                self.collection.load()
+                self.loaded = True
             
             # Search
-            search_params = {
-                "metric_type": "COSINE",
-                "params": {"nprobe": 10}
-            }
-            
             results = self.collection.search(
                 data=[query_emb],
                 anns_field="embedding",
-                param=search_params,
+                param=SEARCH_PARAMS,
                 limit=top_k,
-                output_fields=["content", "metadata"]
+                output_fields=OUTPUT_FIELDS
             )
             
-            # Convert results to Document objects
-            out_docs = []
-            for hits in results:
-                for hit in hits:
-                    out_docs.append(
-                        Document(
-                            page_content=hit.entity.get('content'),
-                            metadata=hit.entity.get('metadata') if hit.entity.get('metadata') else {}
-                        )
-                    )
+            # Convert the hits of the single query vector to Document objects
+            out_docs = [
+                Document(
+                    page_content=hit.entity.get('content'),
+                    metadata=hit.entity.get('metadata') or {}
+                )
+                for hit in results[0]
+            ]
             
             print(f"✅ Found {len(out_docs)} documents in Milvus")
-            return time.time() - start_time, out_docs
+            return time.perf_counter() - start_time, out_docs
             
         except Exception as e:
             print(f"❌ Error querying Milvus: {str(e)}")
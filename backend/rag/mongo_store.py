@@ -1,24 +1,112 @@
 import time
 import os
+import logging
+import threading
 from typing import List, Tuple
 from langchain.schema import Document
-from pymongo import MongoClient
+from .utils import to_float_list, normalize_embeddings
+from bson.binary import Binary, BinaryVectorDtype
+from pymongo import MongoClient, WriteConcern
 from pymongo.errors import ServerSelectionTimeoutError, OperationFailure, ConfigurationError
 import numpy as np
 
+# Per-query and per-document messages go to this logger instead of stdout
+logger = logging.getLogger(__name__)
+
+# Format of stored embeddings: "int8" stores scalar-quantized integers as a
+# BSON int8 vector (one byte per dimension, indexable by Atlas Vector
+# Search); "f32" keeps the floats. Cosine similarity ignores vector length,
+# so no per-vector scale is stored. Integer arrays written by older versions
+# are still read.
+MONGO_VEC_DTYPE = os.getenv("MONGO_VEC_DTYPE", "int8")
+
+# Float embeddings are stored unit-length, so the search index can rank by
+# plain dot product; int8 vectors are scaled per vector and need cosine
+MONGO_SIMILARITY = "dotProduct" if MONGO_VEC_DTYPE == "f32" else "cosine"
+
+# Connection pool: a few sockets are kept open so the first queries after an
+# idle period don't pay for TLS handshakes
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+
+# Wire compression, in order of preference. Chunk text compresses well, so
+# inserts and fallback reads send far fewer bytes; the driver skips zstd
+# with a warning if the zstandard package is missing
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zstd,zlib")
+MONGO_ZLIB_LEVEL = int(os.getenv("MONGO_ZLIB_LEVEL", "6"))
+
+# Write concern for document inserts: "majority" (the connection default)
+# waits for replication; 1 acknowledges on the primary only and 0 does not
+# wait at all, trading durability for ingest throughput
+MONGO_INGEST_W = os.getenv("MONGO_INGEST_W", "majority")
+
+# Atlas Vector Search index over the embedding field, and the number of
+# nearest-neighbour candidates it examines per query: at least
+# MONGO_NUM_CANDIDATES_MIN and MONGO_NUM_CANDIDATES_FACTOR times top_k.
+# More candidates improve recall at the cost of latency.
+MONGO_VECTOR_INDEX = os.getenv("MONGO_VECTOR_INDEX", "vector_index")
+MONGO_NUM_CANDIDATES_FACTOR = int(os.getenv("MONGO_NUM_CANDIDATES_FACTOR", "20"))
+MONGO_NUM_CANDIDATES_MIN = int(os.getenv("MONGO_NUM_CANDIDATES_MIN", "150"))
+
+# Seconds between checks whether a freshly created search index has finished
+# building; until then queries use the manual similarity search
+VECTOR_INDEX_PROBE_INTERVAL = 30.0
+
+def _quantize(embedding) -> Binary:
+    """Scale an embedding into the int8 range, round it and pack it as a BSON vector"""
+    vector = np.asarray(embedding, dtype=np.float32)
+    scale = 127.0 / max(float(np.abs(vector).max()), 1e-9)
+    return Binary.from_vector(np.round(vector * scale).astype(np.int8).tolist(), BinaryVectorDtype.INT8)
+
+def _decode_embedding(embedding):
+    """Return a stored embedding as a sequence of numbers"""
+    if isinstance(embedding, Binary):
+        # Two header bytes (dtype, padding) precede the int8 values
+        return np.frombuffer(embedding, dtype=np.int8, offset=2)
+    return embedding
+
+# The in-memory search matrix is kept in float16 to halve its size. NumPy
+# has no fast float16 matmul, so rows are upcast and scored in blocks. A
+# block's float32 copy is sized to stay within a typical per-core L2 cache,
+# so it is read back from cache by the dot product rather than from DRAM.
+SCAN_BLOCK_BYTES = int(os.getenv("MONGO_SCAN_BLOCK_BYTES", str(256 * 1024)))
+SCAN_BLOCK_ROWS = 1024
+
+def _block_scores(matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Dot every float16 row of matrix with a float32 query vector"""
+    scores = np.empty(len(matrix), dtype=np.float32)
+    rows = max(1, SCAN_BLOCK_BYTES // (4 * max(matrix.shape[1], 1)))
+    for start in range(0, len(matrix), rows):
+        block = matrix[start:start + rows].astype(np.float32)
+        np.dot(block, query, out=scores[start:start + len(block)])
+    return scores
+
 class MongoVectorStore:
-    def __init__(self, embedding_model=None):
+    def __init__(self, embedding_model=None, embedding_dim: int = None):
         self.embedding_model = embedding_model
         self.initialized = False
         self.client = None
         self.db = None
         self.collection = None
+        self.ingest_collection = None
         self.vector_search_available = False
-        self.embedding_dim = 768  # Default dimension
+        self.vector_index_name = MONGO_VECTOR_INDEX
+        self._vector_index_pending = False
+        self._vector_index_checked_at = 0.0
+        self.embedding_dim = embedding_dim or 768  # Default dimension
+        
+        # In-memory copy of the collection for similarity search: one
+        # L2-normalized float16 row per document, reloaded after inserts
+        self._emb_matrix = None
+        self._contents = []
+        self._metadatas = []
+        self._emb_dirty = True
+        self._emb_lock = threading.Lock()
         
         try:
-            # Get embedding dimension from model if available
-            if embedding_model:
+            # Get embedding dimension from model unless the caller provided it
+            if embedding_model and embedding_dim is None:
                 test_embedding = self.embedding_model.embed_query("test")
                 self.embedding_dim = len(test_embedding)
                 print(f"✅ Detected embedding dimension: {self.embedding_dim}")
@@ -37,7 +125,12 @@ class MongoVectorStore:
                     self.mongo_url, 
                     serverSelectionTimeoutMS=5000,
                     connectTimeoutMS=5000,
-                    socketTimeoutMS=10000
+                    socketTimeoutMS=10000,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                    compressors=MONGO_COMPRESSORS,
+                    zlibCompressionLevel=MONGO_ZLIB_LEVEL
                 )
                 # Test the connection
                 self.client.admin.command('ping')
@@ -46,6 +139,8 @@ class MongoVectorStore:
                 # Initialize database and collection
                 self.db = self.client["my_vector_database"]
                 self.collection = self.db["my_vector_collection"]
+                ingest_w = int(MONGO_INGEST_W) if MONGO_INGEST_W.isdigit() else MONGO_INGEST_W
+                self.ingest_collection = self.collection.with_options(write_concern=WriteConcern(w=ingest_w))
                 
                 # Try to create a standard index on content for text search fallback
                 try:
@@ -54,23 +149,38 @@ class MongoVectorStore:
                 except Exception as e:
                     print(f"⚠️ Note: Could not create content index: {str(e)}")
                 
-                # Try to create vector search index if available
+                # Use Atlas Vector Search when the cluster supports it, so
+                # ranking happens server-side and only top_k documents are sent
                 try:
-                    # Check if Atlas Vector Search is available by attempting to create an index
-                    index_model = [("embedding", "vector")]
-                    
-                    self.collection.create_index(
-                        index_model,
-                        name="vector_index",
-                    )
-                    
-                    # If it reaches here, basic vector index created - try to use Atlas Search
-                    # This will be used by the manual similarity search method
-                    print("✅ Created basic vector index")
-                    self.vector_search_available = False
+                    index = self._probe_vector_index()
+                    if index is None:
+                        self.db.command({
+                            "createSearchIndexes": self.collection.name,
+                            "indexes": [{
+                                "name": self.vector_index_name,
+                                "type": "vectorSearch",
+                                "definition": {
+                                    "fields": [{
+                                        "type": "vector",
+                                        "path": "embedding",
+                                        "numDimensions": self.embedding_dim,
+                                        "similarity": MONGO_SIMILARITY
+                                    }]
+                                }
+                            }]
+                        })
+                        print("✅ Created Atlas Vector Search index")
+                    # A new index answers queries with no results until it
+                    # has been built, so only switch to it once it is queryable
+                    if index is not None and index.get("queryable", True):
+                        self.vector_search_available = True
+                    else:
+                        print("⚠️ Atlas Vector Search index is building, using manual search until it is ready")
+                        self._vector_index_pending = True
+                        self._vector_index_checked_at = time.monotonic()
                     
                 except Exception as vector_index_error:
-                    print(f"ℹ️ Basic vector index not supported: {str(vector_index_error)}")
+                    print(f"ℹ️ Atlas Vector Search not supported: {str(vector_index_error)}")
                     print("⚠️ Will use manual vector similarity search")
                     self.vector_search_available = False
                 
@@ -87,109 +197,127 @@ class MongoVectorStore:
             print(f"❌ Error initializing MongoDB: {str(e)}")
             self.initialized = False
     
-    def add_documents(self, documents: List[Document]) -> float:
+    def add_documents(self, documents: List[Document], embeddings: List[List[float]] = None) -> float:
         if not self.initialized:
-            print("❌ Cannot add documents: MongoDB not initialized")
-            return 0.0
+            raise RuntimeError("Cannot add documents: MongoDB not initialized")
             
-        start_time = time.time()
+        start_time = time.perf_counter()
         try:
-            # Store content and embeddings in batches
-            batch_size = 50
-            total_docs = 0
+            # Use the precomputed embeddings or get them from the model in
+            # one batched call
+            if embeddings is None:
+                embeddings = self.embedding_model.embed_documents([doc.page_content for doc in documents])
             
-            for i in range(0, len(documents), batch_size):
-                batch = documents[i:min(i + batch_size, len(documents))]
-                docs_to_insert = []
-                
-                for doc in batch:
-                    try:
-                        embedding = self.embedding_model.embed_query(doc.page_content)
-                        
-                        # Ensure embedding has correct dimension
-                        if len(embedding) != self.embedding_dim:
-                            print(f"⚠️ Embedding dimension mismatch: expected {self.embedding_dim}, got {len(embedding)}")
-                            # Adjust if needed to avoid errors
-                            if len(embedding) > self.embedding_dim:
-                                embedding = embedding[:self.embedding_dim]
-                            else:
-                                # Pad with zeros if too short
-                                embedding = embedding + [0] * (self.embedding_dim - len(embedding))
-                        
-                        docs_to_insert.append({
-                            "content": doc.page_content,
-                            "metadata": doc.metadata if doc.metadata else {},
-                            "embedding": embedding
-                        })
-                    except Exception as doc_error:
-                        print(f"❌ Error processing document: {str(doc_error)}")
-                
-                if docs_to_insert:
-                    self.collection.insert_many(docs_to_insert)
-                    total_docs += len(docs_to_insert)
+            # All embeddings come from one model, so checking the first one
+            # is enough to catch a model/dimension mismatch
+            if len(embeddings) and len(embeddings[0]) != self.embedding_dim:
+                raise ValueError(f"Embedding dimension mismatch: expected {self.embedding_dim}, got {len(embeddings[0])}")
+            
+            if MONGO_VEC_DTYPE == "f32":
+                embeddings = normalize_embeddings(embeddings)
+            
+            docs_to_insert = []
+            
+            for doc, embedding in zip(documents, embeddings):
+                try:
+                    docs_to_insert.append({
+                        "content": doc.page_content,
+                        "metadata": doc.metadata if doc.metadata else {},
+                        "embedding": _quantize(embedding) if MONGO_VEC_DTYPE == "int8" else to_float_list(embedding)
+                    })
+                except Exception as doc_error:
+                    logger.warning("Error processing document: %s", doc_error)
+            
+            # One bulk call; pymongo splits it into as few wire messages as
+            # the server's size limits allow
+            total_docs = 0
+            if docs_to_insert:
+                self.ingest_collection.insert_many(docs_to_insert, ordered=False)
+                total_docs = len(docs_to_insert)
+                self._emb_dirty = True
             
             print(f"✅ Added {total_docs} documents to MongoDB")
-            return time.time() - start_time
+            return time.perf_counter() - start_time
         except Exception as e:
             print(f"❌ Error adding documents to MongoDB: {str(e)}")
-            return 0.0
+            raise
 
-    def query(self, query_text: str, top_k: int = 5) -> Tuple[float, List[Document]]:
+    def query(self, query_text: str, top_k: int = 5, query_embedding: List[float] = None) -> Tuple[float, List[Document]]:
+        """
+        Find the documents most similar to a query
+
+        Args:
+            query_text: Query text, embedded unless query_embedding is given
+            top_k: Number of documents to return
+            query_embedding: Precomputed query embedding
+
+        Returns:
+            Tuple[float, List[Document]]: Query time and matching documents
+        """
         if not self.initialized:
             print("❌ Cannot query: MongoDB not initialized")
             return 0.0, []
             
-        start_time = time.time()
+        start_time = time.perf_counter()
         try:
-            # Get query embedding
-            query_emb = self.embedding_model.embed_query(query_text)
+            # Get query embedding unless the caller already computed it;
+            # unit length, as the stored vectors are
+            if query_embedding is not None:
+                query_emb = to_float_list(normalize_embeddings(query_embedding))
+            else:
+                query_emb = to_float_list(normalize_embeddings(self.embedding_model.embed_query(query_text)))
             
-            # Manual cosine similarity search
-            print("Using manual cosine similarity search")
+            if self._vector_index_pending:
+                self._check_vector_index()
             
-            # Get all documents
-            all_docs = list(self.collection.find())
-            print(f"Retrieved {len(all_docs)} documents for manual similarity search")
+            if self.vector_search_available:
+                try:
+                    return time.perf_counter() - start_time, self._vector_search(query_emb, top_k)
+                except OperationFailure as search_error:
+                    # e.g. the search index is still building
+                    logger.warning("Atlas Vector Search failed, using manual search: %s", search_error)
             
-            if not all_docs:
-                print("⚠️ No documents found in collection")
-                return time.time() - start_time, []
+            # Manual cosine similarity search over the cached embedding matrix
+            with self._emb_lock:
+                if self._emb_dirty:
+                    # Cleared before reloading so an insert that lands
+                    # during the reload triggers another one next time
+                    self._emb_dirty = False
+                    self._refresh_cache()
+                matrix, contents, metadatas = self._emb_matrix, self._contents, self._metadatas
             
-            # Calculate similarity scores
-            docs_with_scores = []
-            for doc in all_docs:
-                if "embedding" in doc and "content" in doc:
-                    try:
-                        score = self._cosine_similarity(query_emb, doc["embedding"])
-                        docs_with_scores.append((score, doc))
-                    except Exception as score_error:
-                        print(f"⚠️ Error calculating similarity: {str(score_error)}")
+            if not contents:
+                logger.warning("No documents found in collection")
+                return time.perf_counter() - start_time, []
             
-            # Sort by similarity score (descending)
-            docs_with_scores.sort(key=lambda x: x[0], reverse=True)
+            # Rows are unit length, so one matrix-vector product gives the
+            # cosine similarity of every document
+            scores = _block_scores(matrix, normalize_embeddings(query_emb))
             
-            # Take top_k results
-            top_results = docs_with_scores[:top_k]
+            # Partial selection of the top_k scores, then sort only those
+            k = min(top_k, len(scores))
+            top_indices = np.argpartition(-scores, k - 1)[:k]
+            top_indices = top_indices[np.argsort(-scores[top_indices])]
             
             # Convert to Document objects
             out_docs = []
-            for score, doc in top_results:
+            for i in top_indices:
                 out_docs.append(
                     Document(
-                        page_content=doc["content"],
-                        metadata={**doc.get("metadata", {}), "score": score}
+                        page_content=contents[i],
+                        metadata={**metadatas[i], "score": float(scores[i])}
                     )
                 )
             
-            print(f"✅ Found {len(out_docs)} documents using cosine similarity")
-            return time.time() - start_time, out_docs
+            logger.debug("Found %d documents using cosine similarity", len(out_docs))
+            return time.perf_counter() - start_time, out_docs
             
         except Exception as e:
             print(f"❌ Error during similarity search: {str(e)}")
             # Ultimate fallback - just return some documents
             try:
-                print("Trying basic document retrieval fallback")
-                all_docs = list(self.collection.find().limit(top_k))
+                logger.info("Trying basic document retrieval fallback")
+                all_docs = list(self.collection.find({}, {"_id": 0, "content": 1, "metadata": 1}).limit(top_k))
                 out_docs = [
                     Document(
                         page_content=doc["content"],
@@ -198,26 +326,96 @@ class MongoVectorStore:
                     for doc in all_docs
                     if "content" in doc
                 ]
-                print(f"✅ Found {len(out_docs)} documents using basic fallback")
-                return time.time() - start_time, out_docs
+                logger.debug("Found %d documents using basic fallback", len(out_docs))
+                return time.perf_counter() - start_time, out_docs
             except Exception as fallback_e:
                 print(f"❌ Error in basic fallback: {str(fallback_e)}")
                 return 0.0, []
     
-    def _cosine_similarity(self, a, b):
-        """Calculate cosine similarity between two vectors"""
+    def _refresh_cache(self):
+        """Load every stored embedding into one L2-normalized float16 matrix"""
+        contents = []
+        metadatas = []
+        
+        # Decode each embedding straight into a preallocated matrix instead
+        # of materializing the whole result set first. Documents inserted
+        # after the count mark the cache dirty and load on the next refresh.
+        matrix = np.empty((self.collection.count_documents({}), self.embedding_dim), dtype=np.float16)
+        cursor = self.collection.find(
+            {}, {"_id": 0, "content": 1, "metadata": 1, "embedding": 1}
+        ).batch_size(1000)
+        for doc in cursor:
+            if len(contents) == len(matrix):
+                break
+            embedding = doc.get("embedding")
+            if embedding is not None:
+                embedding = _decode_embedding(embedding)
+            if "content" not in doc or embedding is None or len(embedding) != self.embedding_dim:
+                continue
+            matrix[len(contents)] = embedding
+            contents.append(doc["content"])
+            metadatas.append(doc.get("metadata") or {})
+        
+        matrix = matrix[:len(contents)]
+        for start in range(0, len(matrix), SCAN_BLOCK_ROWS):
+            block = matrix[start:start + SCAN_BLOCK_ROWS]
+            block[:] = normalize_embeddings(block)
+        
+        self._emb_matrix = matrix
+        self._contents = contents
+        self._metadatas = metadatas
+        print(f"Loaded {len(contents)} MongoDB embeddings for similarity search")
+    
+    def _probe_vector_index(self):
+        """Return the definition of this store's Atlas search index, or None if it does not exist"""
+        return next(iter(self.collection.list_search_indexes(name=self.vector_index_name)), None)
+    
+    def _check_vector_index(self):
+        """Enable Atlas Vector Search once a pending index has finished building"""
+        now = time.monotonic()
+        if now - self._vector_index_checked_at < VECTOR_INDEX_PROBE_INTERVAL:
+            return
+        self._vector_index_checked_at = now
         try:
-            a_array = np.array(a, dtype=float)
-            b_array = np.array(b, dtype=float)
-            
-            # Check for zero vectors to avoid division by zero
-            a_norm = np.linalg.norm(a_array)
-            b_norm = np.linalg.norm(b_array)
-            
-            if a_norm == 0 or b_norm == 0:
-                return 0.0
-                
-            return float(np.dot(a_array, b_array) / (a_norm * b_norm))
-        except Exception as e:
-            print(f"⚠️ Error in cosine similarity calculation: {str(e)}")
-            return 0.0
\ No newline at end of file
+            index = self._probe_vector_index()
+        except OperationFailure as e:
+            print(f"⚠️ Could not check Atlas Vector Search index: {str(e)}")
+            return
+        if index is not None and index.get("queryable", False):
+            self._vector_index_pending = False
+            self.vector_search_available = True
+            print("✅ Atlas Vector Search index is ready")
+    
+    def _vector_search(self, query_emb: List[float], top_k: int) -> List[Document]:
+        """Rank documents server-side with an Atlas $vectorSearch aggregation"""
+        num_candidates = max(top_k * MONGO_NUM_CANDIDATES_FACTOR, MONGO_NUM_CANDIDATES_MIN)
+        pipeline = [
+            {
+                "$vectorSearch": {
+                    "index": self.vector_index_name,
+                    "path": "embedding",
+                    "queryVector": query_emb,
+                    "numCandidates": num_candidates,
+                    "limit": top_k
+                }
+            },
+            {
+                # Inclusion projection, so stored embeddings never leave the server
+                "$project": {
+                    "_id": 0,
+                    "content": 1,
+                    "metadata": 1,
+                    "score": {"$meta": "vectorSearchScore"}
+                }
+            }
+        ]
+        
+        out_docs = [
+            Document(
+                page_content=doc["content"],
+                metadata={**(doc.get("metadata") or {}), "score": doc["score"]}
+            )
+            for doc in self.collection.aggregate(pipeline)
+        ]
+        logger.debug("Found %d documents using Atlas Vector Search", len(out_docs))
+        return out_docs
@@ -1,24 +1,59 @@
 import time
 import os
+import io
 import json
+import struct
+import logging
+import threading
+import weakref
+from contextlib import contextmanager
 from typing import List, Tuple
 from langchain.schema import Document
+from .utils import normalize_embeddings
 import psycopg2
 from psycopg2.extensions import STATUS_READY
 from psycopg2.extras import execute_values, Json
+from psycopg2.pool import ThreadedConnectionPool
 import numpy as np
 # Import register_vector from pgvector.psycopg2
 from pgvector.psycopg2 import register_vector
 
+# Per-query and per-row messages go to this logger instead of stdout, so
+# busy searches and ingests don't serialize on console writes
+logger = logging.getLogger(__name__)
+
+# Searches run on a pool of connections so concurrent requests don't share
+# one transaction; each connection prepares the search statement once
+PG_POOL_MAX_CONNECTIONS = int(os.getenv("PG_POOL_MAX_CONNECTIONS", "16"))
+SEARCH_STATEMENT = """
+    PREPARE vec_search (vector, int) AS
+    SELECT content, metadata, embedding <#> $1 AS distance
+    FROM document_chunks
+    WHERE embedding IS NOT NULL
+    ORDER BY distance
+    LIMIT $2
+"""
+
+# Inserts of at least this many rows are streamed with binary COPY, which
+# sends vectors as raw float4 instead of text literals
+COPY_MIN_ROWS = 5000
+
 # No manual adapter needed
 
 class PGVectorStore:
-    def __init__(self, embedding_model=None):
+    def __init__(self, embedding_model=None, embedding_dim: int = None):
         self.embedding_model = embedding_model
         self.initialized = False
         self.conn = None
+        self.pool = None
+        # Connections that have the search statement prepared. Held weakly,
+        # so a connection the pool discards drops out instead of an unrelated
+        # new connection inheriting its id
+        self._prepared_conns = weakref.WeakSet()
+        self._prepared_lock = threading.Lock()
         # Use model's actual dimension
-        self.embedding_dim = 768  # Default for Google embeddings
+        self.embedding_dim = embedding_dim or 768  # Default for Google embeddings
+        self.index_type = None
         
         try:
             # Get PostgreSQL credentials from environment variables
@@ -31,7 +66,7 @@ class PGVectorStore:
             print(f"Connecting to PostgreSQL at {db_host}:{db_port}")
             
             # Connect to PostgreSQL
-            self.conn = psycopg2.connect(
+            self.conn_params = dict(
                 host=db_host,
                 port=db_port,
                 user=db_user,
@@ -39,6 +74,7 @@ class PGVectorStore:
                 database=db_name,
                 connect_timeout=10
             )
+            self.conn = psycopg2.connect(**self.conn_params)
             self.conn.autocommit = False
             
             # Register the vector type handler with psycopg2
@@ -49,8 +85,8 @@ class PGVectorStore:
                 print(f"❌ Error registering pgvector handler: {reg_error}")
                 raise # Reraise error if registration fails, as it's critical
 
-            # Get actual embedding dimension from the model
-            if self.embedding_model:
+            # Get actual embedding dimension from the model unless the caller provided it
+            if self.embedding_model and embedding_dim is None:
                 test_embedding = self.embedding_model.embed_query("test")
                 self.embedding_dim = len(test_embedding)
                 print(f"✅ Detected embedding dimension: {self.embedding_dim}")
@@ -142,25 +178,62 @@ class PGVectorStore:
             else:
                 print(f"✅ Using existing table with correct dimension {self.embedding_dim}")
             
-            # Create index for vector similarity search
+            # Create index for vector similarity search. HNSW (pgvector 0.5+)
+            # gives much better recall at low latency than ivfflat; older
+            # servers fall back to ivfflat
             with self.conn.cursor() as cur:
                 try:
+                    cur.execute("SELECT 1 FROM pg_am WHERE amname = 'hnsw';")
+                    self.index_type = "hnsw" if cur.fetchone() else "ivfflat"
+                    
                     # First check if index exists to avoid error
                     cur.execute("""
-                        SELECT 1 FROM pg_indexes 
+                        SELECT indexdef FROM pg_indexes 
                         WHERE indexname = 'document_chunks_embedding_idx';
                     """)
-                    if cur.fetchone() is None:  # Index doesn't exist
-                        cur.execute("""
-                            CREATE INDEX document_chunks_embedding_idx 
-                            ON document_chunks 
-                            USING ivfflat (embedding vector_cosine_ops)
-                            WITH (lists = 100);
-                        """)
+                    row = cur.fetchone()
+                    # Embeddings are stored unit-length and searched by inner
+                    # product, so an index built for another distance or
+                    # index type is replaced
+                    if row is not None and (
+                        "vector_ip_ops" not in row[0] or f"USING {self.index_type}" not in row[0]
+                    ):
+                        cur.execute("DROP INDEX document_chunks_embedding_idx;")
+                        print("Dropped outdated vector index")
+                        if "vector_ip_ops" not in row[0]:
+                            # Rows written for the old distance may not be
+                            # unit length; normalize them once, before the
+                            # new index is built
+                            cur.execute("SAVEPOINT normalize_rows;")
+                            try:
+                                cur.execute("UPDATE document_chunks SET embedding = l2_normalize(embedding);")
+                                normalized = cur.rowcount
+                                cur.execute("RELEASE SAVEPOINT normalize_rows;")
+                                print(f"✅ Normalized {normalized} existing embeddings for inner product search")
+                            except psycopg2.Error as norm_error:
+                                # l2_normalize needs pgvector 0.7+
+                                cur.execute("ROLLBACK TO SAVEPOINT normalize_rows;")
+                                print(f"⚠️ Could not normalize existing embeddings, re-upload documents for accurate results: {str(norm_error)}")
+                        row = None
+                    if row is None:  # Index doesn't exist
+                        if self.index_type == "hnsw":
+                            cur.execute("""
+                                CREATE INDEX document_chunks_embedding_idx 
+                                ON document_chunks 
+                                USING hnsw (embedding vector_ip_ops)
+                                WITH (m = 16, ef_construction = 64);
+                            """)
+                        else:
+                            cur.execute("""
+                                CREATE INDEX document_chunks_embedding_idx 
+                                ON document_chunks 
+                                USING ivfflat (embedding vector_ip_ops)
+                                WITH (lists = 100);
+                            """)
                         self.conn.commit()
-                        print("✅ Created vector search index")
+                        print(f"✅ Created {self.index_type} vector search index")
                     else:
-                        print("✅ Vector search index already exists")
+                        print(f"✅ Vector search index ({self.index_type}) already exists")
                 except Exception as e:
                     print(f"⚠️ Error creating index (non-critical): {str(e)}")
                     self.conn.rollback()
@@ -172,6 +245,8 @@ class PGVectorStore:
                     cur.execute("SELECT COUNT(*) FROM document_chunks;")
                     count = cur.fetchone()[0]
                     print(f"✅ Connected to pgvector. Current document count: {count}")
+                    self.conn.rollback()
+                    self.pool = ThreadedConnectionPool(1, PG_POOL_MAX_CONNECTIONS, **self.conn_params)
                     self.initialized = True
                 except Exception as e:
                     print(f"❌ Error verifying table: {str(e)}")
@@ -181,147 +256,178 @@ class PGVectorStore:
         except Exception as e:
             print(f"❌ Error initializing pgvector: {str(e)}")
             self.initialized = False
+        finally:
+            # Setup is done; queries and ingests borrow pooled connections,
+            # so the setup connection is not kept open
             if self.conn:
                 try:
                     self.conn.close()
                 except:
                     pass
+                self.conn = None
     
-    def add_documents(self, documents: List[Document]) -> float:
+    def add_documents(self, documents: List[Document], embeddings: List[List[float]] = None) -> float:
         if not self.initialized:
-            print("❌ Cannot add documents: pgvector not initialized")
-            return 0.0
+            raise RuntimeError("Cannot add documents: pgvector not initialized")
         
-        start_time = time.time()
+        start_time = time.perf_counter()
         added_count = 0
         print(f"Adding {len(documents)} documents to pgvector...")
         
         try:
-            with self.conn.cursor() as cur:
-                # Get initial count
-                cur.execute("SELECT COUNT(*) FROM document_chunks;")
-                initial_count = cur.fetchone()[0]
-                print(f"Initial document count: {initial_count}")
-                
-                data = []
-                for i, doc in enumerate(documents):
+            # Use the precomputed embeddings or get them from the model
+            # in one batched call
+            if embeddings is None:
+                embeddings = self.embedding_model.embed_documents([doc.page_content for doc in documents])
+            
+            # Store unit-length vectors so search can use inner product. Rows
+            # stay float32 arrays, which pgvector's adapter binds as vector
+            # literals rather than float8 arrays that need a cast
+            embeddings = normalize_embeddings(embeddings)
+            
+            data = []
+            for i, doc in enumerate(documents):
+                try:
+                    embedding = embeddings[i]
+                    
+                    metadata = doc.metadata if doc.metadata else {}
+                    
+                    # Add to batch insert
+                    data.append((doc.page_content, metadata, embedding))
+                    
+                except Exception as e:
+                    logger.warning("Error processing document %d for add: %s", i + 1, e)
+            
+            if not data:
+                print("⚠️ No valid documents processed to add")
+                return time.perf_counter() - start_time
+            
+            # Each ingest runs in its own pooled connection and transaction,
+            # so concurrent uploads don't interleave on one session; a failed
+            # insert is rolled back when the connection is returned
+            with self._pooled_connection() as conn, conn.cursor() as cur:
+                print(f"Inserting {len(data)} documents into pgvector...")
+                copied = False
+                if len(data) >= COPY_MIN_ROWS:
                     try:
-                        if i % 50 == 0:
-                            print(f"Processing document {i+1}/{len(documents)}...")
-                            
-                        # Get embedding from model - use actual dimensions
-                        embedding = self.embedding_model.embed_query(doc.page_content)
-                        
-                        # Handle metadata - ensure it's JSON serializable
-                        metadata = Json(doc.metadata if doc.metadata else {})
-                        
-                        # Add to batch insert
-                        data.append((doc.page_content, metadata, embedding))
-                        
-                    except Exception as e:
-                        print(f"❌ Error processing document {i+1} for add: {str(e)}")
-                
-                if data:
-                    print(f"Inserting {len(data)} documents into pgvector...")
+                        self._copy_rows(cur, data)
+                        copied = True
+                    except psycopg2.Error as copy_error:
+                        print(f"⚠️ Binary COPY failed, falling back to INSERT: {str(copy_error)}")
+                        conn.rollback()
+                if not copied:
                     execute_values(
                         cur,
                         """
                         INSERT INTO document_chunks (content, metadata, embedding)
                         VALUES %s
                         """,
-                        data
+                        [(content, Json(metadata), embedding) for content, metadata, embedding in data],
+                        page_size=500  # Rows per INSERT statement (default is 100)
                     )
-                    self.conn.commit()
-                    added_count = len(data)
-                    
-                    # Verify documents were added
-                    cur.execute("SELECT COUNT(*) FROM document_chunks;")
-                    new_count = cur.fetchone()[0]
-                    actual_added = new_count - initial_count
-                    
-                    if actual_added == added_count:
-                        print(f"✅ Successfully added {added_count} documents to pgvector (verified)")
-                    else:
-                        print(f"⚠️ Expected to add {added_count} documents, but count increased by {actual_added}")
-                else:
-                    print("⚠️ No valid documents processed to add")
+                conn.commit()
+                added_count = len(data)
             
-            return time.time() - start_time
+            print(f"✅ Successfully added {added_count} documents to pgvector")
+            return time.perf_counter() - start_time
             
         except psycopg2.Error as e:
             print(f"❌ Database error adding documents to pgvector: {str(e)}")
-            if self.conn:
-                try:
-                    self.conn.rollback()
-                    print("Rolled back transaction due to add error.")
-                except Exception as rb_error:
-                    print(f"⚠️ Error during rollback attempt after add error: {rb_error}")
-            return 0.0
+            raise
         except Exception as e:
             print(f"❌ Unexpected error adding documents to pgvector: {str(e)}")
-            if self.conn:
-                try: self.conn.rollback() 
-                except Exception: pass
-            return 0.0
+            raise
+
+    def _copy_rows(self, cur, data: List[Tuple[str, dict, np.ndarray]]) -> None:
+        """Bulk-load (content, metadata, embedding) rows with binary COPY"""
+        buf = io.BytesIO()
+        # Signature, flags and header extension length
+        buf.write(b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0))
+        for content, metadata, embedding in data:
+            vector = np.asarray(embedding, dtype=">f4")
+            fields = (
+                content.encode("utf-8"),
+                # jsonb binary format: version byte followed by the JSON text
+                b"\x01" + json.dumps(metadata).encode("utf-8"),
+                # pgvector binary format: dimensions, unused, big-endian float4s
+                struct.pack("!hh", len(vector), 0) + vector.tobytes()
+            )
+            buf.write(struct.pack("!h", len(fields)))
+            for field in fields:
+                buf.write(struct.pack("!i", len(field)))
+                buf.write(field)
+        buf.write(struct.pack("!h", -1))
+        buf.seek(0)
+        
+        cur.copy_expert(
+            "COPY document_chunks (content, metadata, embedding) FROM STDIN WITH (FORMAT BINARY)",
+            buf
+        )
+
+    @contextmanager
+    def _pooled_connection(self):
+        """Borrow a pooled connection, preparing the search statement on first use"""
+        conn = self.pool.getconn()
+        try:
+            with self._prepared_lock:
+                prepared = conn in self._prepared_conns
+            if not prepared:
+                register_vector(conn)
+                with conn.cursor() as cur:
+                    cur.execute(SEARCH_STATEMENT)
+                conn.commit()
+                with self._prepared_lock:
+                    self._prepared_conns.add(conn)
+            yield conn
+        finally:
+            # End any open transaction (and any SET LOCAL) before returning it
+            if conn.status != STATUS_READY:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+            self.pool.putconn(conn)
 
-    def query(self, query_text: str, top_k: int = 5) -> Tuple[float, List[Document]]:
+    def query(self, query_text: str, top_k: int = 5, query_embedding: List[float] = None) -> Tuple[float, List[Document]]:
         if not self.initialized:
             print("❌ Cannot query: pgvector not initialized")
             return 0.0, []
             
-        start_time = time.time()
+        start_time = time.perf_counter()
         out_docs = []
         
         try:
-            # First check if we have any data in the table
-            with self.conn.cursor() as cur:
-                try:
-                    cur.execute("SELECT COUNT(*) FROM document_chunks;")
-                    count = cur.fetchone()[0]
-                    if count == 0:
-                        print("⚠️ pgvector database is empty - no documents to search")
-                        print("   Please upload documents first.")
-                        return time.time() - start_time, []
-                    else:
-                        print(f"pgvector database has {count} documents to search")
-                except Exception as e:
-                    print(f"❌ Error checking document count: {str(e)}")
-                    self.conn.rollback()
-            
-            # Get query embedding
-            print(f"Getting embedding for query: {query_text[:50]}...")
-            query_emb = self.embedding_model.embed_query(query_text)
-            print(f"Embedding dimension: {len(query_emb)}")
+            # Get query embedding unless the caller already computed it; as a
+            # float32 array it is bound through pgvector's adapter
+            if query_embedding is not None:
+                query_emb = normalize_embeddings(query_embedding)
+            else:
+                logger.debug("Getting embedding for query: %s...", query_text[:50])
+                query_emb = normalize_embeddings(self.embedding_model.embed_query(query_text))
+            logger.debug("Embedding dimension: %d", len(query_emb))
             
-            with self.conn.cursor() as cur:
-                # Reset transaction state if necessary
-                if self.conn.status != STATUS_READY:
-                     self.conn.rollback() 
-                     print("Rolled back potentially aborted transaction before query.")
-                     
+            with self._pooled_connection() as conn, conn.cursor() as cur:
                 try:
-                    # Use cosine similarity for vector search with parameter binding
-                    query_sql = """
-                        SELECT content, metadata, embedding <=> %s::vector AS distance
-                        FROM document_chunks
-                        WHERE embedding IS NOT NULL
-                        ORDER BY embedding <=> %s::vector 
-                        LIMIT %s
-                    """
+                    # Widen the HNSW candidate list with the result size
+                    # (applies to the current transaction only)
+                    if self.index_type == "hnsw":
+                        cur.execute("SET LOCAL hnsw.ef_search = %s", (max(top_k * 20, 40),))
                     
-                    # Pass embedding directly as parameter (twice - once for select, once for order by)
-                    print("Executing vector search query...")
-                    cur.execute(query_sql, (query_emb, query_emb, top_k))
+                    # Both sides are unit-length, so negative inner product
+                    # ranks like cosine distance without the per-row norms
+                    logger.debug("Executing vector search query...")
+                    cur.execute("EXECUTE vec_search (%s::vector, %s)", (query_emb, top_k))
                     
                     results = cur.fetchall()
-                    print(f"Query returned {len(results)} results")
-                    
+                    # The search has no filter, so no rows means no documents
+                    if not results:
+                        logger.warning("pgvector database is empty - upload documents first")
                     # Show similarity scores for debugging
-                    if results:
-                        print("Similarity scores:")
+                    if results and logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Query returned %d results", len(results))
                         for i, row in enumerate(results):
                             similarity = row[2] if len(row) > 2 else "unknown"
-                            print(f"  Result {i+1}: distance={similarity}")
+                            logger.debug("  Result %d: distance=%s", i + 1, similarity)
                     
                     # Convert results to Document objects
                     for row in results:
@@ -333,24 +439,17 @@ class PGVectorStore:
                             doc = Document(page_content=content, metadata=metadata)
                             out_docs.append(doc)
                         except Exception as doc_error:
-                            print(f"❌ Error processing result row: {str(doc_error)}")
+                            logger.warning("Error processing result row: %s", doc_error)
                             
-                    print(f"✅ Found {len(out_docs)} documents in pgvector")
+                    logger.debug("Found %d documents in pgvector", len(out_docs))
                     
                 except psycopg2.Error as db_error:
                     print(f"❌ Database error during vector search: {str(db_error)}")
-                    self.conn.rollback() 
-                    print("Rolled back transaction due to query error.")
                     
                 except Exception as search_error:
                     print(f"❌ Unexpected error during vector search: {str(search_error)}")
-                    try: self.conn.rollback() 
-                    except Exception: pass
             
         except Exception as e:
             print(f"❌ Error querying pgvector (outer scope): {str(e)}")
-            if self.conn:
-                try: self.conn.rollback() 
-                except Exception: pass
                      
-        return time.time() - start_time, out_docs
\ No newline at end of file
+        return time.perf_counter() - start_time, out_docs
@@ -1,51 +1,83 @@
 import os
 import uuid
+import shutil
+import functools
 from typing import Dict, List
+import numpy as np
 from werkzeug.utils import secure_filename
 
 def get_unique_id() -> str:
     """Generate a unique ID"""
-    return str(uuid.uuid4())
+    return uuid.uuid4().hex
 
-def save_uploaded_file(file, upload_dir: str = "uploads") -> str:
+@functools.lru_cache(maxsize=None)
+def get_default_embeddings():
+    """Shared OpenAI embedding model for stores created without one"""
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings()
+
+def save_uploaded_file(file, upload_dir: str = "uploads", data: bytes = None) -> str:
     """
     Save an uploaded file to disk with a secure filename
     
     Args:
         file: File object from request
-        upload_dir: Directory to save the file
+        upload_dir: Existing directory to save the file in
+        data: File content already read from the request (optional)
         
     Returns:
         str: Path to the saved file
     """
-    # Create upload directory if it doesn't exist
-    os.makedirs(upload_dir, exist_ok=True)
-    
     # Get secure filename and add unique ID to avoid collisions
     filename = secure_filename(file.filename)
     unique_filename = f"{get_unique_id()}_{filename}"
     file_path = os.path.join(upload_dir, unique_filename)
     
-    # Save the file
-    file.save(file_path)
+    # Save the file, copying the upload stream in chunks when its content
+    # has not been read yet so it is never held in memory as a whole
+    with open(file_path, "wb") as f:
+        if data is not None:
+            f.write(data)
+        else:
+            shutil.copyfileobj(file.stream, f, length=1 << 20)
     
     return file_path
 
+def to_float_list(vector) -> List[float]:
+    """Convert an embedding (list or NumPy array) to a plain list of floats"""
+    if hasattr(vector, "tolist"):
+        return vector.tolist()
+    return list(vector)
+
+def normalize_embeddings(vectors) -> np.ndarray:
+    """
+    L2-normalize embeddings so inner product equals cosine similarity
+    
+    Args:
+        vectors: One embedding, or a matrix with one embedding per row
+        
+    Returns:
+        np.ndarray: float32 array of the same shape with unit-length rows
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    # Leave all-zero vectors unchanged instead of dividing by zero
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
 def format_document_for_display(doc):
     """Format a document for display in frontend"""
-    if not hasattr(doc, 'page_content'):
+    try:
+        content = doc.page_content
+    except AttributeError:
         return {
             "content": str(doc),
             "metadata": {}
         }
-        
-    metadata = {}
-    if hasattr(doc, 'metadata'):
-        metadata = doc.metadata
     
     return {
-        "content": doc.page_content,
-        "metadata": metadata
+        "content": content,
+        "metadata": getattr(doc, "metadata", None) or {}
     }
 
 def format_results(query_time, results):
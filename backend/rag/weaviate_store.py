@@ -1,16 +1,137 @@
 import time
 import os
-import json
+import logging
+import functools
+import threading
+import orjson
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Tuple
 from langchain.schema import Document
+from .utils import to_float_list
 import weaviate
+from urllib.parse import urlparse
+from weaviate.classes.config import Configure, DataType, Property, VectorDistances
+from weaviate.classes.init import AdditionalConfig, Auth, Timeout
 from weaviate.util import generate_uuid5
 
+# Per-query and per-object messages go to this logger instead of stdout
+logger = logging.getLogger(__name__)
+
+# Documents are embedded in chunks of this size when add_documents has to
+# compute the vectors itself. The client sizes the import batches on its own
+# (dynamic batching), adapting to server latency.
+WEAVIATE_BATCH_SIZE = int(os.getenv("WEAVIATE_BATCH_SIZE", "100"))
+
+# Port of the gRPC API for self-hosted instances; Weaviate Cloud clusters
+# are reached through the cloud helper, which knows their gRPC endpoint
+WEAVIATE_GRPC_PORT = int(os.getenv("WEAVIATE_GRPC_PORT", "50051"))
+WEAVIATE_CONNECT_ATTEMPTS = 3
+
+# Server-side vector compression for newly created collections: "pq"
+# (product quantization, trained once WEAVIATE_PQ_TRAINING_LIMIT objects
+# exist), "sq" (8-bit scalar quantization), "bq" (binary, rescored) or
+# "none" to keep full float32 vectors in the index
+WEAVIATE_QUANTIZER = os.getenv("WEAVIATE_QUANTIZER", "none").lower()
+WEAVIATE_PQ_TRAINING_LIMIT = int(os.getenv("WEAVIATE_PQ_TRAINING_LIMIT", "100000"))
+
+# HNSW graph parameters for newly created collections. ef=-1 lets the
+# server pick the search list size per query from the limit, between the
+# dynamic bounds.
+HNSW_EF_CONSTRUCTION = 128
+HNSW_MAX_CONNECTIONS = 32
+HNSW_DYNAMIC_EF_MIN = 100
+HNSW_DYNAMIC_EF_MAX = 500
+
+def _vector_index_config():
+    """HNSW index settings with the quantizer selected by WEAVIATE_QUANTIZER"""
+    quantizers = {
+        "pq": lambda: Configure.VectorIndex.Quantizer.pq(training_limit=WEAVIATE_PQ_TRAINING_LIMIT),
+        "sq": lambda: Configure.VectorIndex.Quantizer.sq(training_limit=WEAVIATE_PQ_TRAINING_LIMIT),
+        "bq": lambda: Configure.VectorIndex.Quantizer.bq(),
+    }
+    quantizer = quantizers[WEAVIATE_QUANTIZER]() if WEAVIATE_QUANTIZER in quantizers else None
+    return Configure.VectorIndex.hnsw(
+        distance_metric=VectorDistances.COSINE,
+        ef_construction=HNSW_EF_CONSTRUCTION,
+        max_connections=HNSW_MAX_CONNECTIONS,
+        ef=-1,
+        dynamic_ef_min=HNSW_DYNAMIC_EF_MIN,
+        dynamic_ef_max=HNSW_DYNAMIC_EF_MAX,
+        quantizer=quantizer
+    )
+
+# Collections already checked or created, per (url, collection name)
+_verified_collections = set()
+_verified_collections_lock = threading.Lock()
+
+# Serializes batch imports across stores sharing one client
+_batch_lock = threading.Lock()
+
+@functools.lru_cache(maxsize=8)
+def _connect(url: str, api_key: str):
+    """
+    Open a v4 (gRPC) client for a Weaviate Cloud cluster or a custom URL
+    
+    Clients are shared per (url, api_key), so every store in the process
+    reuses one connection instead of repeating the TLS and auth setup.
+    
+    Args:
+        url: REST endpoint of the instance
+        api_key: API key, or an empty string for anonymous access
+        
+    Returns:
+        weaviate.WeaviateClient: Connected client
+    """
+    auth = Auth.api_key(api_key) if api_key else None
+    additional_config = AdditionalConfig(timeout=Timeout(init=10, query=30, insert=120))
+    
+    parsed = urlparse(url)
+    host = parsed.hostname or url
+    if host.endswith((".weaviate.network", ".weaviate.cloud")):
+        return weaviate.connect_to_weaviate_cloud(
+            cluster_url=url,
+            auth_credentials=auth,
+            additional_config=additional_config
+        )
+    
+    secure = parsed.scheme == "https"
+    return weaviate.connect_to_custom(
+        http_host=host,
+        http_port=parsed.port or (443 if secure else 80),
+        http_secure=secure,
+        grpc_host=host,
+        grpc_port=WEAVIATE_GRPC_PORT,
+        grpc_secure=secure,
+        auth_credentials=auth,
+        additional_config=additional_config
+    )
+
+def _metadata_json(metadata: dict, cache: dict) -> str:
+    """
+    Serialize chunk metadata, reusing the string for repeated metadata
+    
+    Chunks of one document usually carry equal metadata dicts, so the
+    encoded string is memoized by the dict's items for the current import.
+    """
+    if not metadata:
+        return "{}"
+    try:
+        key = frozenset(metadata.items())
+    except TypeError:
+        # Unhashable values (lists, nested dicts) are encoded every time
+        return orjson.dumps(metadata, option=orjson.OPT_NON_STR_KEYS).decode()
+    encoded = cache.get(key)
+    if encoded is None:
+        encoded = cache[key] = orjson.dumps(metadata, option=orjson.OPT_NON_STR_KEYS).decode()
+    return encoded
+
 class WeaviateVectorStore:
     def __init__(self, embedding_model=None):
         self.embedding_model = embedding_model
         self.initialized = False
         self.client = None
+        self.collection = None
         
         try:
             # Get Weaviate credentials from environment variables
@@ -19,161 +140,196 @@ class WeaviateVectorStore:
             
             print(f"Connecting to Weaviate at {weaviate_url}")
             
-            # Initialize Weaviate client with longer timeout
-            try:
-                self.client = weaviate.Client(
-                    url=weaviate_url,
-                    auth_client_secret=weaviate.AuthApiKey(api_key=weaviate_api_key),
-                    timeout_config=(10, 30)  # (connect_timeout, read_timeout) in seconds
-                )
-                
-                # Test connection
-                print("Testing Weaviate connection...")
-                self.client.schema.get()
-                print("Connection successful!")
-                
-                # Define the target schema
-                target_schema = {
-                    "class": "Document",
-                    "description": "A document with text content and metadata",
-                    "vectorizer": "none",  # We'll provide our own vectors
-                    "properties": [
-                        {
-                            "name": "content",
-                            "dataType": ["text"],
-                            "description": "The content of the document"
-                        },
-                        {
-                            "name": "metadata",
-                            "dataType": ["text"],  # Store metadata as JSON string
-                            "description": "Metadata associated with the document (JSON string)"
-                        }
-                    ]
-                }
-                
-                # Create or update schema if necessary
-                if not self.client.schema.exists("Document"):
-                    print("Creating Document schema...")
-                    self.client.schema.create({"classes": [target_schema]})
-                    print("✅ Created schema in Weaviate")
-                else:
-                    # Optional: Check if existing schema matches and update if needed
-                    # current_schema = self.client.schema.get("Document")
-                    # if current_schema != target_schema: # Implement more robust comparison if needed
-                    #     print("Schema mismatch, attempting update...")
-                    #     self.client.schema.update_config("Document", target_schema) # Or delete and recreate
-                    print("✅ Document schema already exists")
-                
-                self.initialized = True
-                print("✅ Successfully connected to Weaviate and verified schema")
-                
-            except Exception as conn_error:
-                print(f"❌ Weaviate connection/schema error: {str(conn_error)}")
-                self.initialized = False
-                # Simplified retry: Just try connecting again, assuming schema issue was transient or fixed externally
+            # Initialize the gRPC client; vectors go over the wire as packed
+            # floats instead of JSON number arrays. Transient connection
+            # failures are retried with exponential backoff.
+            for attempt in range(WEAVIATE_CONNECT_ATTEMPTS):
                 try:
-                    print("Retrying basic connection test...")
-                    # Re-initialize client without schema creation attempt in retry
-                    self.client = weaviate.Client(
-                        url=weaviate_url,
-                        auth_client_secret=weaviate.AuthApiKey(api_key=weaviate_api_key),
-                        timeout_config=(10, 30)
-                    )
-                    self.client.schema.get() # Simple connection test
-                    print("✅ Connection successful on retry, proceeding.")
-                    # Assume schema exists or will be handled later if needed
-                    self.initialized = True
-                except Exception as retry_error:
-                     print(f"❌ Weaviate retry failed: {str(retry_error)}")
-                     self.initialized = False
+                    # Connecting already checks that the REST and gRPC
+                    # endpoints answer, so no separate readiness probe is needed
+                    self.client = _connect(weaviate_url, weaviate_api_key)
+                    break
+                except Exception as conn_error:
+                    print(f"❌ Weaviate connection error (attempt {attempt + 1}/{WEAVIATE_CONNECT_ATTEMPTS}): {str(conn_error)}")
+                    if attempt + 1 < WEAVIATE_CONNECT_ATTEMPTS:
+                        time.sleep(0.5 * 2 ** attempt)
+            else:
+                return
+            print("Connection successful!")
+            
+            # Create the collection if necessary (once per process)
+            with _verified_collections_lock:
+                self._ensure_collection(weaviate_url)
+            
+            self.collection = self.client.collections.get("Document")
+            self.initialized = True
+            print("✅ Successfully connected to Weaviate and verified schema")
                 
         except Exception as e:
             print(f"❌ Error initializing Weaviate: {str(e)}")
             self.initialized = False
     
-    def add_documents(self, documents: List[Document]) -> float:
+    def _ensure_collection(self, weaviate_url: str):
+        """Create the Document collection unless this process already verified it"""
+        if (weaviate_url, "Document") in _verified_collections:
+            return
+        if not self.client.collections.exists("Document"):
+            print("Creating Document schema...")
+            self.client.collections.create(
+                name="Document",
+                description="A document with text content and metadata",
+                vectorizer_config=Configure.Vectorizer.none(),  # We'll provide our own vectors
+                vector_index_config=_vector_index_config(),
+                properties=[
+                    Property(
+                        name="content",
+                        data_type=DataType.TEXT,
+                        description="The content of the document"
+                    ),
+                    Property(
+                        name="metadata",
+                        data_type=DataType.TEXT,  # Store metadata as JSON string
+                        description="Metadata associated with the document (JSON string)"
+                    )
+                ]
+            )
+            print("✅ Created schema in Weaviate")
+        else:
+            print("✅ Document schema already exists")
+        _verified_collections.add((weaviate_url, "Document"))
+    
+    def _document_uuid(self, content: str) -> str:
+        """
+        Deterministic object ID for a chunk
+        
+        Whitespace and case are normalized first, so chunks that differ
+        only in formatting overwrite each other instead of being stored
+        twice. The embedding model is part of the key because vectors from
+        different models are not comparable.
+        """
+        normalized = " ".join(content.split()).lower()
+        model_name = getattr(self.embedding_model, "model_name", "")
+        return generate_uuid5(f"{model_name}:{normalized}")
+    
+    def _embedded_documents(self, documents: List[Document], embeddings: List[List[float]] = None):
+        """
+        Yield (document, embedding) pairs
+        
+        Without precomputed embeddings, documents are embedded in chunks of
+        WEAVIATE_BATCH_SIZE and the next chunk is embedded in the background
+        while the caller adds the current one to the import batch.
+        """
+        if embeddings is not None:
+            yield from zip(documents, embeddings)
+            return
+        
+        chunks = [documents[i:i + WEAVIATE_BATCH_SIZE] for i in range(0, len(documents), WEAVIATE_BATCH_SIZE)]
+        if not chunks:
+            return
+        
+        def embed(chunk):
+            return np.asarray(self.embedding_model.embed_documents([doc.page_content for doc in chunk]), dtype=np.float32)
+        
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="weaviate-embed") as pool:
+            future = pool.submit(embed, chunks[0])
+            for i, chunk in enumerate(chunks):
+                chunk_embeddings = future.result()
+                if i + 1 < len(chunks):
+                    future = pool.submit(embed, chunks[i + 1])
+                yield from zip(chunk, chunk_embeddings)
+    
+    def add_documents(self, documents: List[Document], embeddings: List[List[float]] = None) -> float:
         if not self.initialized:
-            print("❌ Cannot add documents: Weaviate not initialized")
-            return 0.0
+            raise RuntimeError("Cannot add documents: Weaviate not initialized")
             
-        start_time = time.time()
+        start_time = time.perf_counter()
         added_count = 0
+        metadata_strings = {}
+        seen_ids = set()
         try:
-            # Use batch processing for better performance
-            with self.client.batch as batch:
-                batch.batch_size = 20  # Set smaller batch size
-                batch.timeout_retries = 3  # Retry on timeout
-                
-                for doc in documents:
-                    try:
-                        # Generate embedding
-                        embedding = self.embedding_model.embed_query(doc.page_content)
-                        
+            # The batch context and its failed_objects belong to the shared
+            # client, so concurrent uploads import one at a time
+            with _batch_lock:
+                # Use batch processing for better performance; the client sizes
+                # and sends the batches concurrently in the background
+                with self.collection.batch.dynamic() as batch:
+                    for doc, embedding in self._embedded_documents(documents, embeddings):
+                        # Repeated chunks map to the same object, so send each once
+                        doc_id = self._document_uuid(doc.page_content)
+                        if doc_id in seen_ids:
+                            continue
+                        seen_ids.add(doc_id)
+                    
                         # Create document object with JSON stringified metadata
                         doc_obj = {
                             "content": doc.page_content,
-                            "metadata": json.dumps(doc.metadata if doc.metadata else {}) # Serialize to JSON string
+                            "metadata": _metadata_json(doc.metadata, metadata_strings) # Serialize to JSON string
                         }
-                        
-                        # Generate a consistent ID based on content
-                        doc_id = generate_uuid5(doc.page_content)
-                        
+                    
                         # Add to batch
-                        batch.add_data_object(
-                            data_object=doc_obj,
-                            class_name="Document",
+                        batch.add_object(
+                            properties=doc_obj,
                             uuid=doc_id,
                             vector=embedding
                         )
                         added_count += 1
-                    except Exception as e:
-                        print(f"❌ Error adding document (UUID: {doc_id if 'doc_id' in locals() else 'N/A'}) to batch: {str(e)}")
+            
+                # Per-object errors come back from the server when the batches
+                # are flushed; report the objects it rejected
+                failed_objects = self.collection.batch.failed_objects
+                for failed in failed_objects:
+                    logger.warning("Weaviate rejected object %s: %s", failed.original_uuid or "N/A", failed.message)
+                added_count -= len(failed_objects)
+            if failed_objects:
+                raise RuntimeError(f"Weaviate rejected {len(failed_objects)} of {len(documents)} documents")
             
             print(f"✅ Attempted to add {len(documents)} documents, successfully processed {added_count} for Weaviate batch.")
-            return time.time() - start_time
+            return time.perf_counter() - start_time
             
         except Exception as e:
             print(f"❌ Error adding documents to Weaviate: {str(e)}")
-            return 0.0
+            raise
 
-    def query(self, query_text: str, top_k: int = 5) -> Tuple[float, List[Document]]:
+    def query(self, query_text: str, top_k: int = 5, query_embedding: List[float] = None,
+              return_metadata: bool = True) -> Tuple[float, List[Document]]:
+        # With return_metadata=False only the content is fetched and the
+        # returned documents have empty metadata
         if not self.initialized:
             print("❌ Cannot query: Weaviate not initialized")
             return 0.0, []
             
-        start_time = time.time()
+        start_time = time.perf_counter()
         try:
-            # Get query embedding
-            query_emb = self.embedding_model.embed_query(query_text)
+            # Get query embedding unless the caller already computed it
+            if query_embedding is not None:
+                query_emb = to_float_list(query_embedding)
+            else:
+                query_emb = to_float_list(self.embedding_model.embed_query(query_text))
             
             # Perform vector search
-            result = (
-                self.client.query
-                .get("Document", ["content", "metadata"])
-                .with_near_vector({
-                    "vector": query_emb,
-                    "certainty": 0.6  # Lower threshold to get more results
-                })
-                .with_limit(top_k)
-                .do()
+            result = self.collection.query.near_vector(
+                near_vector=query_emb,
+                certainty=0.6,  # Lower threshold to get more results
+                limit=top_k,
+                return_properties=["content", "metadata"] if return_metadata else ["content"]
             )
             
             # Extract results
             docs = []
-            if (result and "data" in result and 
-                "Get" in result["data"] and 
-                "Document" in result["data"]["Get"]):
-                
-                for item in result["data"]["Get"]["Document"]:
+            if result and result.objects:
+                for obj in result.objects:
+                    item = obj.properties
+                    if not return_metadata:
+                        docs.append(Document(page_content=item["content"]))
+                        continue
                     try:
                         # Ensure metadata is properly handled and deserialized
                         metadata_str = item.get("metadata", "{}")
-                        # Handle potential None or empty strings explicitly
-                        if not metadata_str:
-                            metadata_str = "{}"
-                        metadata = json.loads(metadata_str)
-                    except json.JSONDecodeError:
-                        print(f"⚠️ Could not decode metadata JSON: {metadata_str}")
+                        # Empty metadata (the common case for split chunks)
+                        # needs no parsing
+                        metadata = orjson.loads(metadata_str) if metadata_str and metadata_str != "{}" else {}
+                    except orjson.JSONDecodeError:
+                        logger.warning("Could not decode metadata JSON: %s", metadata_str)
                         metadata = {} # Fallback to empty dict
                     
                     docs.append(
@@ -183,9 +339,9 @@ class WeaviateVectorStore:
                         )
                     )
             
-            print(f"✅ Found {len(docs)} documents in Weaviate")
-            return time.time() - start_time, docs
+            logger.debug("Found %d documents in Weaviate", len(docs))
+            return time.perf_counter() - start_time, docs
             
         except Exception as search_error:
             print(f"❌ Error during Weaviate search: {str(search_error)}")
-            return time.time() - start_time, []
\ No newline at end of file
+            return time.perf_counter() - start_time, []
\ No newline at end of file
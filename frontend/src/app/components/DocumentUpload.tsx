@@ -1,6 +1,6 @@
 import { useState } from 'react';
 import axios from 'axios';
-import { UploadResponse, DatabaseType } from '../types';
+import { UploadResponse, UploadJobResponse, DatabaseType } from '../types';
 
 interface DocumentUploadProps {
   onUploadComplete: (response: UploadResponse) => void;
@@ -46,9 +46,11 @@ const DocumentUpload: React.FC<DocumentUploadProps> = ({
 
     const formData = new FormData();
     formData.append('file', selectedFile);
+    // Process the document as a background job and poll for the result
+    formData.append('background', 'true');
 
     try {
-      const response = await axios.post<UploadResponse>(
+      const jobResponse = await axios.post<UploadJobResponse>(
         'http://localhost:5000/api/upload',
         formData,
         {
@@ -56,14 +58,30 @@ const DocumentUpload: React.FC<DocumentUploadProps> = ({
         }
       );
 
-      if (response.data.success) {
-        setUploadStatus(response.data);
-        onUploadComplete(response.data);
+      if (!jobResponse.data.success || !jobResponse.data.job_id) {
+        setError(jobResponse.data.message || 'Upload failed');
+        return;
+      }
+
+      let job = jobResponse.data;
+      while (job.status === 'queued' || job.status === 'processing') {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const statusResponse = await axios.get<UploadJobResponse>(
+          `http://localhost:5000/api/upload/${jobResponse.data.job_id}`
+        );
+        job = statusResponse.data;
+        if (!job.success) break;
+      }
+
+      const result = job.result;
+      if (result && result.success) {
+        setUploadStatus(result);
+        onUploadComplete(result);
         
         // Update available databases in parent component if function provided
-        if (setAvailableDatabases && response.data.document.available_dbs) {
+        if (setAvailableDatabases && result.document.available_dbs) {
           const availableDbs: DatabaseType[] = [];
-          Object.entries(response.data.document.available_dbs).forEach(([db, isAvailable]) => {
+          Object.entries(result.document.available_dbs).forEach(([db, isAvailable]) => {
             if (isAvailable) {
               availableDbs.push(db as DatabaseType);
             }
@@ -71,7 +89,7 @@ const DocumentUpload: React.FC<DocumentUploadProps> = ({
           setAvailableDatabases(availableDbs);
         }
       } else {
-        setError(response.data.message || 'Upload failed');
+        setError(result?.message || job.message || 'Upload failed');
       }
     } catch (err: any) {
       console.error('Upload error:', err);
@@ -14,6 +14,7 @@ export default function Home() {
   const [messages, setMessages] = useState<MessageType[]>([]);
   const [isLoading, setIsLoading] = useState(false);
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  const [sessionId] = useState(() => crypto.randomUUID());
   const [availableDatabases, setAvailableDatabases] = useState<DatabaseType[]>(['faiss', 'chroma']);
 
   // RAG-related states
@@ -68,24 +69,49 @@ export default function Home() {
     setIsLoading(true);
 
     try {
-      // Send message to backend
-      const response = await axios.post('http://localhost:5000/api/chat', {
-        message: messageText
+      // Send message to backend and stream the reply as server-sent events
+      const response = await fetch('http://localhost:5000/api/chat', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          message: messageText,
+          session_id: sessionId,
+          stream: true
+        })
       });
 
-      // Add bot response to chat
-      if (response.data.success) {
-        const botMessage: MessageType = {
-          text: response.data.response,
-          sender: 'bot'
-        };
-        setMessages(prev => [...prev, botMessage]);
-      } else {
-        const errorMessage: MessageType = {
-          text: `Error: ${response.data.error || 'Unknown error'}`,
-          sender: 'bot'
-        };
-        setMessages(prev => [...prev, errorMessage]);
+      if (!response.ok || !response.body) {
+        throw new Error(`Chat request failed with status ${response.status}`);
+      }
+
+      // Add an empty bot message and fill it in as chunks arrive
+      setMessages(prev => [...prev, { text: '', sender: 'bot' }]);
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let botText = '';
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop() ?? '';
+
+        for (const event of events) {
+          const dataLine = event.split('\n').find(line => line.startsWith('data: '));
+          if (!dataLine) continue;
+
+          const payload = JSON.parse(dataLine.slice('data: '.length));
+          botText = event.startsWith('event: error')
+            ? `Error: ${payload.error || 'Unknown error'}`
+            : botText + payload.text;
+
+          const botMessage: MessageType = { text: botText, sender: 'bot' };
+          setMessages(prev => [...prev.slice(0, -1), botMessage]);
+        }
       }
     } catch (error) {
       console.error('Error:', error);
@@ -39,6 +39,14 @@ export interface UploadResponse {
   };
 }
 
+export interface UploadJobResponse {
+  success: boolean;
+  message?: string;
+  job_id?: string;
+  status?: 'queued' | 'processing' | 'done' | 'failed';
+  result?: UploadResponse;
+}
+
 export interface DatabaseResult {
   name: string;
   query_time?: number;